@@ -0,0 +1,10 @@
+"""SQLite с журналом медленных запросов, см. ``core.slow_queries``."""
+from django.db.backends.sqlite3 import base
+
+from core.slow_queries import SlowQueryLog
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.execute_wrappers.append(SlowQueryLog(self))
@@ -0,0 +1,82 @@
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 5
+WAIT_STEP = 0.05
+
+
+def _is_cacheable(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_USED')
+    )
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _served(response, state):
+    response['X-Page-Cache'] = state
+    return response
+
+
+def cache_anonymous_page(timeout, stale_timeout, version=None):
+    """Кэширует страницы для анонимных пользователей целиком.
+
+    Свежая копия живёт ``timeout`` секунд, ещё ``stale_timeout`` секунд
+    устаревшая копия отдаётся, пока страницу пересобирает один запрос.
+    Если копии нет, остальные запросы ждут его результата, а не идут
+    в базу параллельно. ``version(request, **kwargs)`` добавляется
+    к ключу, чтобы изменения данных сразу давали новую страницу.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated
+            ):
+                return view(request, *args, **kwargs)
+            key = 'core:page:{}:{}:{}'.format(
+                get_language(),
+                version(request, *args, **kwargs) if version else '',
+                request.get_full_path(),
+            )
+            lock_key = f'{key}:lock'
+            entry = cache.get(key)
+            if entry is not None and time.time() < entry[0]:
+                return _served(entry[1], 'HIT')
+            locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+            if not locked:
+                if entry is not None:
+                    return _served(entry[1], 'STALE')
+                entry = _wait_for(key)
+                if entry is not None:
+                    return _served(entry[1], 'HIT')
+            try:
+                response = view(request, *args, **kwargs)
+                if _is_cacheable(request, response):
+                    cache.set(
+                        key,
+                        (time.time() + timeout, response),
+                        timeout + stale_timeout,
+                    )
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            return _served(response, 'MISS')
+        return wrapper
+    return decorator
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Очищает METRICS_DIR от значений прошлых запусков. Запускается '
+        'перед стартом сервера, пока воркеры ещё не пишут в каталог.'
+    )
+
+    def handle(self, *args, **options):
+        removed = metrics.clear_directory()
+        self.stdout.write(f'Удалено файлов метрик: {removed}')
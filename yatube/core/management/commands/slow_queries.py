@@ -0,0 +1,70 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import slow_queries
+
+SORT_KEYS = {
+    'total': 'total_ms',
+    'max': 'max_ms',
+    'count': 'count',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает самые тяжёлые запросы из журнала медленных запросов, '
+        'сложенные по отпечаткам SQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log',
+            default=settings.SLOW_QUERY_LOG,
+            help='Файл журнала; по умолчанию SLOW_QUERY_LOG.',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=10,
+            help='Сколько запросов показать.',
+        )
+        parser.add_argument(
+            '--sort',
+            choices=sorted(SORT_KEYS),
+            default='total',
+            help='Порядок: суммарное время, худшее время или число.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['log']
+        if not path or not os.path.exists(path):
+            raise CommandError(f'Журнал медленных запросов не найден: {path}')
+        offenders = sorted(
+            slow_queries.aggregate(slow_queries.read(path)),
+            key=lambda offender: offender[SORT_KEYS[options['sort']]],
+            reverse=True,
+        )[:options['limit']]
+        if not offenders:
+            self.stdout.write('Медленных запросов нет.')
+        for number, offender in enumerate(offenders, 1):
+            self._print(number, offender)
+
+    def _print(self, number, offender):
+        self.stdout.write(
+            f'{number}. {offender["count"]} раз, всего '
+            f'{offender["total_ms"]:.1f} мс, худший '
+            f'{offender["max_ms"]:.1f} мс'
+        )
+        self.stdout.write(f'   {offender["sql"]}')
+        self.stdout.write(f'   параметры: {offender["params"]}')
+        if offender['plan']:
+            self.stdout.write('   план:')
+            for line in offender['plan']:
+                self.stdout.write(f'     {line}')
+        for title, field in (('маршруты', 'views'), ('вызовы', 'sites')):
+            for value, count in sorted(
+                offender[field].items(), key=lambda item: -item[1]
+            ):
+                self.stdout.write(f'   {title}: {value} ({count})')
@@ -0,0 +1,374 @@
+"""Метрики сайта в формате Prometheus: счётчики, шкалы и гистограммы.
+
+Значения копятся в памяти процесса. Если задан METRICS_DIR, каждый
+процесс не чаще раза в METRICS_FLUSH_INTERVAL секунд сбрасывает свои
+значения в ``<pid>-<метка>.json`` этого каталога, а страница метрик
+складывает файлы всех воркеров WSGI. Случайная метка не даёт новому
+процессу с тем же pid затереть файл завершившегося.
+
+Счётчики и гистограммы завершившихся воркеров продолжают учитываться,
+иначе суммы уменьшались бы; их шкалы — нет. Страница метрик переносит
+такие файлы в ``archive.json`` и удаляет их. Значения прошлых запусков
+сервера сбрасывает ``clear_directory`` (команда ``clear_metrics``),
+которую вызывают при старте главного процесса, до запуска воркеров.
+"""
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+THUMBNAIL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+ARCHIVE = 'archive.json'
+LOCK = 'metrics.lock'
+
+
+def _escape(value):
+    return (
+        value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+    )
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _locked(directory, operation):
+    """Блокировка каталога: чтение файлов — общая, перенос в архив —
+    исключительная, чтобы страница не посчитала воркер дважды.
+    """
+    with open(os.path.join(directory, LOCK), 'a') as lock:
+        fcntl.flock(lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read(path):
+    """Пара (pid, значения) из файла воркера или None, если он испорчен."""
+    try:
+        with open(path, encoding='utf-8') as source:
+            data = json.load(source)
+        pid, snapshot = data['pid'], data['metrics']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not isinstance(snapshot, dict):
+        return None
+    return pid, snapshot
+
+
+def _write(path, data):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as output:
+        json.dump(data, output)
+    os.replace(temporary, path)
+
+
+def clear_directory(directory=None):
+    """Удаляет из каталога метрик значения прошлых запусков сервера."""
+    directory = directory or settings.METRICS_DIR
+    if not directory or not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
+
+
+class Registry:
+    """Метрики процесса и их сборка по всем воркерам."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.flushed = 0
+        self.pid = None
+        self.file_name = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Метрика {metric.name} уже объявлена')
+        self.metrics[metric.name] = metric
+
+    def snapshot(self):
+        """Значения процесса: ``{имя: [[метки, значение], ...]}``."""
+        with self.lock:
+            return {
+                name: [
+                    [list(labels), metric.copy(value)]
+                    for labels, value in metric.values.items()
+                ]
+                for name, metric in self.metrics.items()
+            }
+
+    def own_file(self):
+        """Имя файла процесса; после fork у потомка оно своё."""
+        pid = os.getpid()
+        if self.pid != pid:
+            self.pid = pid
+            self.file_name = f'{pid}-{uuid.uuid4().hex[:8]}.json'
+        return self.file_name
+
+    def flush(self, force=False):
+        """Сбрасывает значения процесса в METRICS_DIR."""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (
+            not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL
+        ):
+            return
+        self.flushed = now
+        _write(
+            os.path.join(directory, self.own_file()),
+            {'pid': os.getpid(), 'metrics': self.snapshot()},
+        )
+
+    def merge(self, merged, snapshot, alive=True):
+        """Добавляет значения снимка к ``{имя: {метки: значение}}``."""
+        for name, samples in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.type == 'gauge' and not alive):
+                continue
+            values = merged.setdefault(name, {})
+            for labels, value in samples:
+                labels = tuple(labels)
+                if labels in values:
+                    value = metric.merge(values[labels], value)
+                values[labels] = value
+
+    def _worker_snapshots(self, directory):
+        """Тройки (имя файла, жив ли воркер, значения) каталога."""
+        own = self.own_file()
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json') or name == own:
+                continue
+            saved = _read(os.path.join(directory, name))
+            if saved is None:
+                continue
+            pid, snapshot = saved
+            alive = name != ARCHIVE and isinstance(pid, int) and _alive(pid)
+            yield name, alive, snapshot
+
+    def archive(self, directory, names):
+        """Переносит счётчики завершившихся воркеров в архив."""
+        with _locked(directory, fcntl.LOCK_EX):
+            path = os.path.join(directory, ARCHIVE)
+            saved = _read(path)
+            merged = {}
+            if saved is not None:
+                self.merge(merged, saved[1], alive=False)
+            paths = [os.path.join(directory, name) for name in names]
+            for worker in paths:
+                saved = _read(worker)
+                if saved is not None:
+                    self.merge(merged, saved[1], alive=False)
+            _write(path, {'pid': None, 'metrics': {
+                name: [[list(labels), value]
+                       for labels, value in values.items()]
+                for name, values in merged.items()
+            }})
+            for worker in paths:
+                if os.path.exists(worker):
+                    os.remove(worker)
+
+    def collect(self):
+        """Значения всех воркеров: ``{имя: {метки: значение}}``."""
+        merged = {name: {} for name in self.metrics}
+        self.merge(merged, self.snapshot())
+        directory = settings.METRICS_DIR
+        if not directory or not os.path.isdir(directory):
+            return merged
+        finished = []
+        with _locked(directory, fcntl.LOCK_SH):
+            for name, alive, snapshot in self._worker_snapshots(directory):
+                self.merge(merged, snapshot, alive)
+                if not alive and name != ARCHIVE:
+                    finished.append(name)
+        if finished:
+            self.archive(directory, finished)
+        return merged
+
+    def render(self):
+        """Страница метрик в текстовом формате Prometheus."""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for labels, value in sorted(values.items()):
+                lines += metric.expose(labels, value)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush, True)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.registry = registry
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _selector(self, labels, extra=()):
+        pairs = list(zip(self.labels, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join(
+            f'{name}="{_escape(value)}"' for name, value in pairs
+        )
+
+    def copy(self, value):
+        return value
+
+    def merge(self, first, second):
+        return first + second
+
+    def expose(self, labels, value):
+        return [f'{self.name}{self._selector(labels)} {_format(value)}']
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.registry.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Гистограмма с постоянными границами корзин.
+
+    Значение — ``[число попаданий в каждую корзину, сумма, количество]``;
+    последняя корзина — всё, что больше верхней границы.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labels=(),
+                 registry=REGISTRY):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labels, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [
+                    [0] * (len(self.buckets) + 1), 0, 0
+                ]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def copy(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def merge(self, first, second):
+        return [
+            [a + b for a, b in zip(first[0], second[0])],
+            first[1] + second[1],
+            first[2] + second[2],
+        ]
+
+    def expose(self, labels, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, hits in zip(self.buckets + (float('inf'),), counts):
+            cumulative += hits
+            selector = self._selector(labels, [('le', _format(bound))])
+            lines.append(f'{self.name}_bucket{selector} {cumulative}')
+        selector = self._selector(labels)
+        lines.append(f'{self.name}_sum{selector} {_format(total)}')
+        lines.append(f'{self.name}_count{selector} {count}')
+        return lines
+
+
+REQUESTS = Counter(
+    'yatube_http_requests_total',
+    'Ответы сайта по маршруту, методу и статусу.',
+    ('view', 'method', 'status'),
+)
+REQUEST_LATENCY = Histogram(
+    'yatube_http_request_duration_seconds',
+    'Время ответа по маршруту.',
+    LATENCY_BUCKETS,
+    ('view',),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'yatube_http_requests_in_progress',
+    'Запросы, которые обрабатываются прямо сейчас.',
+)
+DB_QUERIES = Histogram(
+    'yatube_db_queries_per_request',
+    'Число SQL-запросов за один ответ по маршруту.',
+    QUERY_BUCKETS,
+    ('view',),
+)
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests_total',
+    'Чтения из кэша по виду ключа (фрагмент шаблона, карточки, '
+    'страницы) и результату: hit или miss.',
+    ('kind', 'result'),
+)
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_generation_seconds',
+    'Время построения миниатюр одной картинки.',
+    THUMBNAIL_BUCKETS,
+)
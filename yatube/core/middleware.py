@@ -0,0 +1,113 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, timing
+from .queries import QueryLog, QueryProblem
+
+logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger('core.timing')
+
+
+class QueryInspectorMiddleware:
+    """Сообщает о N+1 и превышении бюджета запросов страницы.
+
+    Работает, только если включён QUERY_INSPECTOR_ENABLED (по умолчанию
+    в режиме отладки). Бюджеты задаются в QUERY_BUDGETS по имени
+    маршрута; с QUERY_INSPECTOR_RAISE страница вместо предупреждения
+    в журнале падает с ошибкой, что удобно в CI.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryLog() as log:
+            response = self.get_response(request)
+        match = request.resolver_match
+        budget = settings.QUERY_BUDGETS.get(match.view_name) if match else None
+        problems = log.problems(budget)
+        if problems:
+            message = '{} {}:\n{}'.format(
+                request.method, request.get_full_path(), '\n'.join(problems)
+            )
+            if settings.QUERY_INSPECTOR_RAISE:
+                raise QueryProblem(message)
+            logger.warning(message)
+        return response
+
+
+class ServerTimingMiddleware:
+    """Отдаёт замеры запроса в заголовке Server-Timing и в журнал.
+
+    Стоит первой в MIDDLEWARE, чтобы total охватывал весь ответ. Строка
+    журнала ``core.timing`` — JSON с адресом, маршрутом, статусом и
+    замерами; у потоковых ответов тело отдаётся уже после замеров.
+    Заголовок можно отключить SERVER_TIMING_HEADER, а всё целиком —
+    SERVER_TIMING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with timing.collect(request) as timings, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(timing.sql_wrapper)
+                )
+            response = self.get_response(request)
+        total = time.perf_counter() - timings.started
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = timings.header(total)
+        if timing_logger.isEnabledFor(logging.INFO):
+            match = request.resolver_match
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+            }
+            record.update(timings.as_dict(total))
+            timing_logger.info(json.dumps(record, ensure_ascii=False))
+        return response
+
+
+class MetricsMiddleware:
+    """Считает ответы, их время и число SQL-запросов по маршрутам.
+
+    Стоит сразу после ServerTimingMiddleware: число запросов берётся
+    из её замеров.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.REQUESTS_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.REQUESTS_IN_PROGRESS.dec()
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.REQUESTS.inc(
+            view=view, method=request.method, status=response.status_code
+        )
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view)
+        timings = timing.current()
+        if timings is not None:
+            metrics.DB_QUERIES.observe(timings.counts['queries'], view=view)
+        metrics.REGISTRY.flush()
+        return response
@@ -0,0 +1,119 @@
+"""Поиск N+1: отпечатки SQL-запросов и места, откуда они пришли.
+
+Запросы перехватываются через ``connection.execute_wrapper``. Отпечаток
+запроса — его SQL без параметров, где списки IN свёрнуты в один
+параметр, поэтому запросы, различающиеся только значениями, совпадают.
+Если отпечаток повторился больше ``QUERY_REPEAT_LIMIT`` раз за запрос
+к сайту, это почти всегда N+1: объект подгружается в цикле.
+"""
+import os
+import re
+import sys
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+SPACES_RE = re.compile(r'\s+')
+
+# Кадры этих модулей не считаются местом вызова запроса.
+SKIPPED_MODULES = (
+    'core.queries', 'core.middleware', 'core.testing', 'core.slow_queries',
+    'core.db',
+)
+
+
+def fingerprint(sql):
+    sql = IN_LIST_RE.sub('(%s)', sql)
+    return SPACES_RE.sub(' ', sql).strip()
+
+
+def _is_project_frame(frame):
+    filename = frame.f_code.co_filename
+    return (
+        filename.startswith(settings.BASE_DIR + os.sep)
+        and 'site-packages' not in filename
+        and not frame.f_globals.get('__name__', '').startswith(
+            SKIPPED_MODULES
+        )
+    )
+
+
+def call_site():
+    """Строка шаблона и строка кода проекта, которые вызвали запрос."""
+    template = code = None
+    frame = sys._getframe(2)
+    while frame is not None and (template is None or code is None):
+        node = frame.f_locals.get('self')
+        # type(), а не isinstance: ленивые объекты вроде request.user
+        # подгружаются при обращении к __class__ и сделали бы запрос.
+        if (
+            template is None and issubclass(type(node), Node)
+            and getattr(node, 'token', None) is not None
+        ):
+            name = node.origin.template_name or node.origin.name
+            template = f'{name}:{node.token.lineno}'
+        if code is None and _is_project_frame(frame):
+            code = '{}:{}'.format(
+                os.path.relpath(frame.f_code.co_filename, settings.BASE_DIR),
+                frame.f_lineno,
+            )
+        frame = frame.f_back
+    return ' ← '.join(place for place in (template, code) if place)
+
+
+class QueryLog:
+    """Собирает запросы ко всем базам внутри блока with."""
+
+    def __init__(self):
+        self.count = 0
+        self.fingerprints = OrderedDict()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        entry = self.fingerprints.setdefault(
+            fingerprint(sql), {'count': 0, 'sites': OrderedDict()}
+        )
+        entry['count'] += 1
+        site = call_site()
+        entry['sites'][site] = entry['sites'].get(site, 0) + 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrappers = [
+            connection.execute_wrapper(self)
+            for connection in connections.all()
+        ]
+        for wrapper in self._wrappers:
+            wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        for wrapper in reversed(self._wrappers):
+            wrapper.__exit__(*exc_info)
+
+    def repeated(self, limit=None):
+        """Отпечатки, которые повторились больше ``limit`` раз."""
+        if limit is None:
+            limit = settings.QUERY_REPEAT_LIMIT
+        return [
+            (sql, entry['count'], list(entry['sites']))
+            for sql, entry in self.fingerprints.items()
+            if entry['count'] > limit
+        ]
+
+    def problems(self, budget=None, limit=None):
+        """Описания N+1 и превышения бюджета; пустой список — всё в порядке."""
+        lines = []
+        if budget is not None and self.count > budget:
+            lines.append(f'{self.count} запросов при бюджете {budget}')
+        for sql, count, sites in self.repeated(limit):
+            lines.append(f'{count} × {sql}')
+            lines += [f'    из {site}' for site in sites if site]
+        return lines
+
+
+class QueryProblem(Exception):
+    """Запрос к сайту сделал N+1 или вышел за бюджет запросов."""
@@ -0,0 +1,125 @@
+"""Журнал медленных SQL-запросов с планом выполнения.
+
+Бэкенд базы ``core.db`` ставит ``SlowQueryLog`` обёрткой всех запросов
+соединения. Запрос дольше SLOW_QUERY_THRESHOLD_MS попадает строкой JSON
+в SLOW_QUERY_LOG вместе с отпечатком, местом вызова, маршрутом страницы
+и выводом ``EXPLAIN QUERY PLAN``. План строится один раз на отпечаток
+в соединении. Время считается до возврата из ``execute``, как в
+``connection.queries``: чтение строк результата в него не входит.
+Команда ``slow_queries`` складывает журнал по отпечаткам.
+"""
+import datetime
+import json
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db.backends.sqlite3.base import SQLiteCursorWrapper
+
+from . import timing
+from .queries import call_site, fingerprint
+
+logger = logging.getLogger(__name__)
+
+EXPLAINED = ('SELECT', 'WITH')
+SQL_MAX_LENGTH = 2000
+
+
+def explain(connection, sql, params):
+    """Строки ``EXPLAIN QUERY PLAN`` с отступами по вложенности."""
+    cursor = connection.connection.cursor(SQLiteCursorWrapper)
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+class SlowQueryLog:
+    """Обёртка ``execute_wrappers`` одного соединения."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.plans = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            if elapsed >= settings.SLOW_QUERY_THRESHOLD_MS:
+                try:
+                    self.record(sql, params, many, elapsed)
+                except Exception:
+                    logger.exception('Не удалось записать медленный запрос')
+
+    def plan(self, key, sql, params):
+        if key not in self.plans:
+            explained = sql.lstrip().upper().startswith(EXPLAINED)
+            self.plans[key] = (
+                explain(self.connection, sql, params) if explained else []
+            )
+        return self.plans[key]
+
+    def record(self, sql, params, many, elapsed):
+        key = fingerprint(sql)
+        entry = {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'ms': round(elapsed, 2),
+            'fingerprint': key,
+            'sql': sql[:SQL_MAX_LENGTH],
+            'params': repr(params)[:SQL_MAX_LENGTH],
+            'plan': [] if many else self.plan(key, sql, params),
+            'site': call_site(),
+            'view': timing.current_view(),
+            'pid': os.getpid(),
+        }
+        logger.warning('Медленный запрос, %.1f мс: %s', elapsed, key)
+        if settings.SLOW_QUERY_LOG:
+            with open(settings.SLOW_QUERY_LOG, 'a', encoding='utf-8') as log:
+                log.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def read(path):
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            if line.strip():
+                yield json.loads(line)
+
+
+def aggregate(entries):
+    """Сводка по отпечаткам: число, суммарное и худшее время, план.
+
+    План и пример SQL берутся у самого медленного запроса, места вызова
+    и маршруты собираются со всех.
+    """
+    offenders = {}
+    for entry in entries:
+        offender = offenders.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'],
+            'count': 0,
+            'total_ms': 0,
+            'max_ms': 0,
+            'sites': {},
+            'views': {},
+        })
+        offender['count'] += 1
+        offender['total_ms'] += entry['ms']
+        if entry['ms'] >= offender['max_ms']:
+            offender['max_ms'] = entry['ms']
+            offender['sql'] = entry['sql']
+            offender['params'] = entry['params']
+            offender['plan'] = entry['plan']
+        for field, value in (('sites', entry['site']),
+                             ('views', entry['view'])):
+            if value:
+                offender[field][value] = offender[field].get(value, 0) + 1
+    return list(offenders.values())
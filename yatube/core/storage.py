@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(content):
+    """SHA-256 содержимого файла, прочитанного по частям."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, которое называет файлы по хэшу содержимого.
+
+    Каталог из ``upload_to`` сохраняется, имя файла заменяется на
+    ``<aa>/<sha256><расширение>``. Повторная загрузка того же файла
+    не пишет его заново и возвращает уже существующее имя, поэтому
+    одинаковые картинки делят и файл, и построенные по нему миниатюры.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = content_hash(content)
+        dirname = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        name = os.path.join(dirname, digest[:2], digest + extension)
+        if self.exists(name):
+            return name.replace('\\', '/')
+        return super().save(name, content, max_length)
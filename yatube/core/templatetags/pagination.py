@@ -0,0 +1,23 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def elided_page_range(page_obj, on_each_side=2):
+    """Номера страниц вокруг текущей и по краям, пропуски — None."""
+    number = page_obj.number
+    num_pages = page_obj.paginator.num_pages
+    if num_pages <= on_each_side * 2 + 3:
+        return list(range(1, num_pages + 1))
+    pages = [1]
+    if number - on_each_side > 2:
+        pages.append(None)
+    pages.extend(range(
+        max(number - on_each_side, 2),
+        min(number + on_each_side, num_pages - 1) + 1
+    ))
+    if number + on_each_side < num_pages - 1:
+        pages.append(None)
+    pages.append(num_pages)
+    return pages
@@ -0,0 +1,49 @@
+import contextlib
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from .queries import QueryLog
+
+# Настройки на время тестов: миниатюры строятся сразу, а не в пуле,
+# который гонялся бы с тестами за MEDIA_ROOT, и журнал медленных
+# запросов не пишется в файл.
+TEST_SETTINGS = {
+    'THUMBNAIL_WORKERS': 0,
+    'SLOW_QUERY_LOG': '',
+}
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск тестов с настройками TEST_SETTINGS поверх рабочих."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(**TEST_SETTINGS)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryAssertionsMixin:
+    """Проверки для TestCase: нет N+1 и число запросов в пределах бюджета."""
+
+    @contextlib.contextmanager
+    def assertNoRepeatedQueries(self, limit=None):
+        """Падает, если запрос повторился больше ``limit`` раз."""
+        with QueryLog() as log:
+            yield log
+        problems = log.problems(limit=limit)
+        if problems:
+            self.fail('Повторяющиеся запросы (N+1):\n' + '\n'.join(problems))
+
+    @contextlib.contextmanager
+    def assertMaxQueries(self, budget, limit=None):
+        """Падает при N+1 или если запросов больше ``budget``."""
+        with QueryLog() as log:
+            yield log
+        problems = log.problems(budget, limit)
+        if problems:
+            self.fail('Лишние запросы:\n' + '\n'.join(problems))
@@ -0,0 +1,249 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics, slow_queries
+from core.queries import QueryProblem, fingerprint
+from core.testing import QueryAssertionsMixin
+from posts.models import Post
+
+User = get_user_model()
+
+
+class QueryInspectorTest(QueryAssertionsMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for number in range(5):
+            author = User.objects.create_user(username=f'author{number}')
+            Post.objects.create(author=author, text=f'Пост {number}')
+
+    def test_fingerprint_ignores_values(self):
+        """Отпечаток не зависит от значений и длины списка IN."""
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT  *  FROM t WHERE id IN (%s, %s)'),
+        )
+
+    def test_repeated_queries_point_to_template_line(self):
+        """N+1 из шаблона показывает строку шаблона и кода."""
+        template = Template(
+            '{% for post in posts %}\n{{ post.author.username }}{% endfor %}'
+        )
+        with self.assertRaisesMessage(AssertionError, '<unknown source>:2'):
+            with self.assertNoRepeatedQueries():
+                template.render(Context({'posts': Post.objects.all()}))
+        with self.assertNoRepeatedQueries():
+            template.render(Context({
+                'posts': Post.objects.select_related('author')
+            }))
+
+    def test_query_budget(self):
+        """Бюджет ограничивает общее число запросов."""
+        with self.assertRaisesMessage(AssertionError, 'при бюджете 1'):
+            with self.assertMaxQueries(1):
+                list(Post.objects.all())
+                list(User.objects.all())
+
+    @override_settings(
+        QUERY_INSPECTOR_ENABLED=True,
+        QUERY_INSPECTOR_RAISE=True,
+        QUERY_BUDGETS={'posts:index': 0},
+    )
+    def test_middleware_enforces_budgets(self):
+        """Мидлварь проверяет бюджет страницы по имени маршрута."""
+        cache.clear()
+        with self.assertRaises(QueryProblem):
+            Client().get(reverse('posts:index'))
+
+
+class ServerTimingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_header_and_log_line(self):
+        """Замеры страницы приходят в заголовке и строкой журнала."""
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get(reverse('posts:index'))
+        header = response['Server-Timing']
+        for name in ('db;dur=', 'tpl;dur=', 'cache;dur=', 'total;dur='):
+            self.assertIn(name, header)
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertIn(f'desc="SQL {record["queries"]}"', header)
+        self.assertGreater(record['cache_miss'], 0)
+
+    def test_cache_hits_are_counted(self):
+        """Повторная страница берёт фрагменты из кэша."""
+        self.client.get(reverse('posts:index'))
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            self.client.get(reverse('posts:index'))
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertGreater(record['cache_hit'], 0)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_can_be_disabled(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTest(TestCase):
+    def test_histogram_exposition(self):
+        """Корзины гистограммы выводятся нарастающим итогом."""
+        registry = metrics.Registry()
+        latency = metrics.Histogram(
+            'latency', 'Время', (0.1, 1), ('view',), registry=registry
+        )
+        latency.observe(0.05, view='index')
+        latency.observe(0.5, view='index')
+        latency.observe(5, view='index')
+        text = registry.render()
+        self.assertIn('# TYPE latency histogram', text)
+        self.assertIn('latency_bucket{view="index",le="0.1"} 1', text)
+        self.assertIn('latency_bucket{view="index",le="1"} 2', text)
+        self.assertIn('latency_bucket{view="index",le="+Inf"} 3', text)
+        self.assertIn('latency_count{view="index"} 3', text)
+
+    def test_workers_are_summed(self):
+        """Счётчики воркеров складываются, шкалы умерших отбрасываются."""
+        registry = metrics.Registry()
+        hits = metrics.Counter('hits', 'Попадания', registry=registry)
+        busy = metrics.Gauge('busy', 'Заняты', registry=registry)
+        hits.inc(2)
+        busy.set(1)
+        with tempfile.TemporaryDirectory() as directory:
+            dead = {'pid': 2 ** 22 + 1, 'metrics': {
+                'hits': [[[], 3]], 'busy': [[[], 5]],
+            }}
+            with open(os.path.join(directory, 'dead.json'), 'w') as output:
+                json.dump(dead, output)
+            with self.settings(METRICS_DIR=directory):
+                registry.flush(force=True)
+                self.assertTrue(os.path.exists(
+                    os.path.join(directory, registry.own_file())
+                ))
+                text = registry.render()
+        self.assertIn('hits 5', text)
+        self.assertIn('busy 1', text)
+
+    def test_finished_workers_are_archived(self):
+        """Файлы завершившихся воркеров переносятся в архив без потерь."""
+        registry = metrics.Registry()
+        metrics.Counter('hits', 'Попадания', registry=registry)
+        with tempfile.TemporaryDirectory() as directory:
+            for number, value in enumerate((3, 4)):
+                dead = {'pid': 2 ** 22 + number, 'metrics': {
+                    'hits': [[[], value]],
+                }}
+                with open(os.path.join(directory, f'{number}.json'),
+                          'w') as output:
+                    json.dump(dead, output)
+            with open(os.path.join(directory, 'broken.json'), 'w') as output:
+                json.dump(['не', 'снимок'], output)
+            with self.settings(METRICS_DIR=directory):
+                self.assertIn('hits 7', registry.render())
+                self.assertEqual(
+                    sorted(os.listdir(directory)),
+                    ['archive.json', 'broken.json', 'metrics.lock'],
+                )
+                self.assertIn('hits 7', registry.render())
+                out = StringIO()
+                call_command('clear_metrics', stdout=out)
+                self.assertIn('Удалено файлов метрик: 2', out.getvalue())
+                self.assertNotIn('hits 7', registry.render())
+
+    def test_reused_pid_keeps_finished_worker_file(self):
+        """Новый процесс с тем же pid пишет в свой файл."""
+        first, second = metrics.Registry(), metrics.Registry()
+        for registry in (first, second):
+            metrics.Counter('hits', 'Попадания', registry=registry)
+        self.assertNotEqual(first.own_file(), second.own_file())
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_requires_token_or_staff(self):
+        """Страницу метрик видят персонал и сборщик с токеном."""
+        url = reverse('metrics')
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('yatube_http_requests_total{view="posts:index"', text)
+        self.assertIn('yatube_cache_requests_total{kind="index_page"', text)
+        self.assertIn('yatube_db_queries_per_request_bucket', text)
+        staff = User.objects.create_user(username='admin', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class TestRunnerTest(TestCase):
+    def test_test_settings_are_applied(self):
+        """Тесты идут без пула миниатюр и без файла медленных запросов."""
+        self.assertEqual(settings.THUMBNAIL_WORKERS, 0)
+        self.assertEqual(settings.SLOW_QUERY_LOG, '')
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, 'slow.jsonl')
+
+    def test_slow_queries_are_logged_with_plan(self):
+        """Медленный запрос попадает в журнал с планом и маршрутом."""
+        author = User.objects.create_user(username='author')
+        Post.objects.create(author=author, text='Пост')
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG=self.log):
+            with self.assertLogs('core.slow_queries', 'WARNING'):
+                self.client.get(
+                    reverse('posts:profile', args=[author.username])
+                )
+        entries = list(slow_queries.read(self.log))
+        selects = [
+            entry for entry in entries
+            if entry['fingerprint'].startswith('SELECT')
+        ]
+        self.assertTrue(selects)
+        self.assertTrue(all(entry['plan'] for entry in selects))
+        self.assertIn('posts:profile', {entry['view'] for entry in entries})
+
+    def test_command_prints_top_offenders(self):
+        """Команда складывает запросы по отпечаткам и сортирует их."""
+        entry = {
+            'fingerprint': 'SELECT * FROM posts_post WHERE id = %s',
+            'sql': 'SELECT * FROM posts_post WHERE id = %s',
+            'params': '(1,)',
+            'plan': ['SEARCH posts_post USING INTEGER PRIMARY KEY'],
+            'site': 'posts/views.py:10',
+            'view': 'posts:post_detail',
+        }
+        with open(self.log, 'w', encoding='utf-8') as log:
+            for ms in (120, 300):
+                log.write(json.dumps(dict(entry, ms=ms)) + '\n')
+            log.write(json.dumps(dict(
+                entry, fingerprint='SELECT 1', sql='SELECT 1', ms=150,
+            )) + '\n')
+        output = StringIO()
+        call_command('slow_queries', log=self.log, stdout=output)
+        text = output.getvalue()
+        self.assertIn('1. 2 раз, всего 420.0 мс, худший 300.0 мс', text)
+        self.assertIn('SEARCH posts_post USING INTEGER PRIMARY KEY', text)
+        self.assertIn('маршруты: posts:post_detail (2)', text)
+        self.assertLess(text.index('420.0'), text.index('SELECT 1'))
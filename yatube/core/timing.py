@@ -0,0 +1,226 @@
+"""Замеры одного запроса к сайту: SQL, шаблоны, кэш и миниатюры.
+
+Замеры копятся в ``RequestTimings`` текущего потока, пока его открыл
+``ServerTimingMiddleware``; вне запроса замеры не ведутся, но метрики
+кэша из ``core.metrics`` считаются всегда.
+Вложенные замеры с тем же именем не считаются дважды: время
+``get_many`` кэша не складывается со временем вызванных из него ``get``.
+Время шаблонов включает запросы и миниатюры, сделанные при отрисовке.
+"""
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+from sorl.thumbnail.base import ThumbnailBackend
+
+from . import metrics
+
+# Имена замеров в порядке вывода в заголовке Server-Timing.
+METRICS = ('db', 'tpl', 'cache', 'thumb')
+
+MISSING = object()
+
+# Вид ключа кэша для метрик: имя фрагмента {% cache %} или начало ключа
+# до второго двоеточия, например ``posts:card``.
+CACHE_KIND_RE = re.compile(r'template\.cache\.(\w+)|([\w-]+(?::[a-z_]+)?)')
+
+_local = threading.local()
+
+
+class RequestTimings:
+    """Длительности (в секундах) и счётчики одного запроса."""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.started = time.perf_counter()
+        self.durations = defaultdict(float)
+        self.counts = Counter()
+        self.active = set()
+
+    def header(self, total):
+        """Значение заголовка Server-Timing, длительности в миллисекундах."""
+        parts = []
+        for name in METRICS:
+            if name not in self.durations:
+                continue
+            part = f'{name};dur={self.durations[name] * 1000:.1f}'
+            if name == 'db':
+                part += f';desc="SQL {self.counts["queries"]}"'
+            elif name == 'cache':
+                part += ';desc="hit {} miss {}"'.format(
+                    self.counts['cache_hit'], self.counts['cache_miss']
+                )
+            parts.append(part)
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def as_dict(self, total):
+        """Замеры для структурированной строки журнала."""
+        record = {
+            f'{name}_ms': round(duration * 1000, 2)
+            for name, duration in self.durations.items()
+        }
+        record.update(self.counts)
+        record['total_ms'] = round(total * 1000, 2)
+        return record
+
+
+def current():
+    return getattr(_local, 'timings', None)
+
+
+def current_view():
+    """Имя маршрута страницы, которую обрабатывает поток, или None."""
+    timings = current()
+    match = getattr(timings and timings.request, 'resolver_match', None)
+    return match.view_name if match else None
+
+
+@contextmanager
+def collect(request=None):
+    """Открывает замеры запроса в текущем потоке."""
+    previous = current()
+    _local.timings = timings = RequestTimings(request)
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+@contextmanager
+def measure(name):
+    """Добавляет время блока к замеру ``name``.
+
+    Отдаёт ``RequestTimings``, если блок внешний, и None внутри такого же
+    замера или вне запроса.
+    """
+    timings = current()
+    if timings is None or name in timings.active:
+        yield None
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings.durations[name] += time.perf_counter() - started
+        timings.active.discard(name)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Обёртка ``connection.execute_wrapper``: время и число запросов."""
+    timings = current()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.durations['db'] += time.perf_counter() - started
+        timings.counts['queries'] += 1
+
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        with measure('tpl'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django, который замеряет отрисовку страниц.
+
+    Замеряется только внешний шаблон: {% include %} и {% extends %}
+    отрисовываются внутри него.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self
+        )
+
+
+def cache_kind(key):
+    match = CACHE_KIND_RE.match(key)
+    if match is None:
+        return 'other'
+    return match.group(1) or match.group(2)
+
+
+@contextmanager
+def _cache_call():
+    """Отдаёт True только внешнему обращению к кэшу в потоке."""
+    depth = getattr(_local, 'cache_depth', 0)
+    _local.cache_depth = depth + 1
+    try:
+        with measure('cache'):
+            yield depth == 0
+    finally:
+        _local.cache_depth = depth
+
+
+def _count_cache(results):
+    """Учитывает пары (ключ, попадание) в замерах запроса и метриках."""
+    timings = current()
+    kinds = Counter()
+    for key, hit in results:
+        result = 'hit' if hit else 'miss'
+        kinds[cache_kind(key), result] += 1
+        if timings is not None:
+            timings.counts[f'cache_{result}'] += 1
+    for (kind, result), amount in kinds.items():
+        metrics.CACHE_REQUESTS.inc(amount, kind=kind, result=result)
+
+
+class TimedCacheMixin:
+    """Время обращений к кэшу, попадания и промахи.
+
+    Попадания и промахи по видам ключей идут ещё и в метрики, в том
+    числе вне запросов к сайту.
+    """
+
+    def get(self, key, default=None, version=None):
+        with _cache_call() as outermost:
+            value = super().get(key, MISSING, version)
+            if outermost:
+                _count_cache([(key, value is not MISSING)])
+        return default if value is MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with _cache_call() as outermost:
+            found = super().get_many(keys, version)
+            if outermost:
+                _count_cache((key, key in found) for key in keys)
+        return found
+
+    def set(self, *args, **kwargs):
+        with measure('cache'):
+            return super().set(*args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        with measure('cache'):
+            return super().set_many(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with measure('cache'):
+            return super().delete(*args, **kwargs)
+
+
+class TimedLocMemCache(TimedCacheMixin, LocMemCache):
+    pass
+
+
+class TimedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который замеряет поиск и построение миниатюр."""
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        with measure('thumb'):
+            return super().get_thumbnail(file_, geometry_string, **options)
@@ -0,0 +1,164 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+EXIF_ORIENTATION = 0x0112
+
+# Поворот по EXIF выполняется в отдельном процессе: полное
+# декодирование картинки ограничено по памяти и по времени и не
+# раздувает процесс, который обслуживает запросы.
+ORIENTATION_SCRIPT = '''
+import sys
+from PIL import Image, ImageOps
+max_pixels, memory = sys.argv[1:]
+try:
+    import resource
+    resource.setrlimit(resource.RLIMIT_AS, (int(memory), int(memory)))
+except (ImportError, ValueError):
+    pass
+Image.MAX_IMAGE_PIXELS = int(max_pixels)
+with Image.open(sys.stdin.buffer) as image:
+    image_format = image.format
+    image = ImageOps.exif_transpose(image)
+    image.save(sys.stdout.buffer, image_format, quality=90)
+'''
+
+
+class OversizedUpload(UploadedFile):
+    """Файл, приём которого прерван: известны только имя и размер."""
+
+    def __init__(self, name, content_type, size, charset=None):
+        super().__init__(io.BytesIO(), name, content_type, size, charset)
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Перестаёт сохранять файл, как только он превысил UPLOAD_MAX_SIZE.
+
+    Остаток файла вычитывается из запроса и отбрасывается, а форма
+    получает ``OversizedUpload`` и показывает понятную ошибку, не
+    пытаясь открыть картинку.
+    Обработчик должен стоять первым в FILE_UPLOAD_HANDLERS.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            return OversizedUpload(
+                self.file_name, self.content_type, self.received,
+                self.charset,
+            )
+        return None
+
+
+def probe_image(upload):
+    """Формат, размеры и EXIF-ориентация по заголовку файла.
+
+    Пиксели не декодируются: ``Image.open`` читает только заголовок.
+    """
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            orientation = image.getexif().get(EXIF_ORIENTATION)
+            return image.format, image.size, orientation
+    except Exception:
+        return None
+    finally:
+        upload.seek(0)
+
+
+def normalize_orientation(upload):
+    """Поворачивает картинку по EXIF в отдельном ограниченном процессе.
+
+    Процесс читает файл из stdin и пишет результат в безымянный
+    временный файл, так что в памяти веб-процесса картинка не бывает.
+    """
+    if hasattr(upload, 'temporary_file_path'):
+        source = upload.file
+    else:
+        source = tempfile.TemporaryFile()
+        for chunk in upload.chunks():
+            source.write(chunk)
+    source.seek(0)
+    result = tempfile.TemporaryFile()
+    try:
+        subprocess.run(
+            [
+                sys.executable, '-c', ORIENTATION_SCRIPT,
+                str(settings.UPLOAD_MAX_PIXELS),
+                str(settings.UPLOAD_PROCESS_MEMORY),
+            ],
+            stdin=source,
+            stdout=result,
+            stderr=subprocess.DEVNULL,
+            timeout=settings.UPLOAD_PROCESS_TIMEOUT,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        result.close()
+        return None
+    finally:
+        if source is not upload.file:
+            source.close()
+    size = result.seek(0, os.SEEK_END)
+    result.seek(0)
+    return UploadedFile(
+        result, upload.name, upload.content_type, size, upload.charset
+    )
+
+
+def validate_image(upload):
+    """Проверяет загруженную картинку, не декодируя её целиком.
+
+    Размер файла, формат и число пикселей проверяются по заголовку,
+    поэтому огромные картинки и «бомбы» отклоняются сразу. Картинка
+    с EXIF-поворотом возвращается уже развёрнутой.
+    """
+    if upload.size > settings.UPLOAD_MAX_SIZE:
+        raise forms.ValidationError(
+            'Файл слишком большой: %(size)s, можно до %(max)s.',
+            code='file_too_large',
+            params={
+                'size': filesizeformat(upload.size),
+                'max': filesizeformat(settings.UPLOAD_MAX_SIZE),
+            },
+        )
+    probed = probe_image(upload)
+    if probed is None or probed[0] not in ALLOWED_FORMATS:
+        raise forms.ValidationError(
+            'Загрузите картинку в формате JPEG, PNG, GIF или WebP.',
+            code='invalid_image',
+        )
+    image_format, (width, height), orientation = probed
+    if width * height > settings.UPLOAD_MAX_PIXELS:
+        raise forms.ValidationError(
+            'Слишком большое изображение: %(width)s×%(height)s.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height},
+        )
+    if orientation not in (None, 1):
+        upload = normalize_orientation(upload)
+        if upload is None:
+            raise forms.ValidationError(
+                'Не удалось обработать изображение.', code='not_processed'
+            )
+    upload.content_type = Image.MIME.get(image_format)
+    return upload
@@ -1,6 +1,13 @@
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 from http import HTTPStatus
 
+from .metrics import CONTENT_TYPE, REGISTRY
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html',
@@ -20,3 +27,18 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=HTTPStatus.FORBIDDEN)
+
+
+def _metrics_allowed(request):
+    if request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+
+
+def metrics(request):
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    if not _metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
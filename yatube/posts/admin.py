@@ -1,6 +1,49 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 
+from . import search
 from .models import Post, Group, Follow, Comment
+from .paginators import CachedCountPaginator
+
+
+class KnownChoiceAutocompleteSelect(AutocompleteSelect):
+    """Автокомплит, который берёт подпись выбранного значения из формы.
+
+    Обычный AutocompleteSelect делает запрос за выбранным объектом
+    в каждой строке списка; здесь подпись уже известна из объекта,
+    загруженного через list_select_related.
+    """
+
+    known = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = {
+            str(v) for v in value
+            if str(v) not in self.choices.field.empty_values
+        }
+        if self.known is None or not selected <= set(self.known):
+            return super().optgroups(name, value, attr)
+        options = [] if self.is_required else [
+            self.create_option(name, '', '', False, 0)
+        ]
+        for option_value in selected:
+            options.append(self.create_option(
+                name, option_value, self.known[option_value], True,
+                len(options),
+            ))
+        return [(None, options, 0)]
+
+
+class PostChangeListForm(forms.ModelForm):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        widget = self.fields['group'].widget
+        widget = getattr(widget, 'widget', widget)
+        group = self.instance.group if self.instance.group_id else None
+        if isinstance(widget, KnownChoiceAutocompleteSelect):
+            widget.known = {str(group.pk): str(group)} if group else {}
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -12,10 +55,49 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs.setdefault('widget', KnownChoiceAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'),
+            ))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', PostChangeListForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        # Без фильтров число постов берётся из кэша ленты вместо
+        # COUNT(*) по всей таблице на каждой странице списка.
+        if queryset.query.where:
+            return super().get_paginator(
+                request, queryset, per_page, orphans, allow_empty_first_page
+            )
+        return CachedCountPaginator(queryset, per_page, 'index')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск идёт по индексу FTS5 вместо LIKE '%...%' по всей таблице.
+        if not search_term or not search.is_available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return search.filter_posts(queryset, search_term), False
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug')
+    search_fields = ('title',)
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = (
@@ -25,6 +107,9 @@ class CommentAdmin(admin.ModelAdmin):
         'text',
         'created'
     )
+    list_select_related = ('post', 'author')
+    autocomplete_fields = ('post', 'author')
+    show_full_result_count = False
 
 
 class FollowAdmin(admin.ModelAdmin):
@@ -33,11 +118,14 @@ class FollowAdmin(admin.ModelAdmin):
         'user',
         'author',
     )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
 
 
 admin.site.register(Post, PostAdmin)
 
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
 
 admin.site.register(Comment, CommentAdmin)
 
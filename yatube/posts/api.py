@@ -0,0 +1,216 @@
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_safe
+
+from core.decorators import cache_anonymous_page
+from . import counters, feeds, timeline
+from .models import Comment, Group, Post, TimelineEntry
+from .paginators import CursorPaginator
+from .views import (
+    COMMENTS_PER_PAGE, PAGE_CACHE_TIMEOUT, PAGE_STALE_TIMEOUT,
+    POSTS_PER_PAGE, group_etag, group_version, index_etag, post_etag,
+    post_version, profile_etag,
+)
+
+User = get_user_model()
+
+# Поле ответа -> колонка для values(). Модели постов не создаются:
+# строки приходят словарями и сразу превращаются в JSON.
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = ('id', 'author__username', 'text', 'created')
+
+IMAGE_STORAGE = Post._meta.get_field('image').storage
+
+
+def api_response(data, status=200):
+    return JsonResponse(
+        data,
+        status=status,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def not_found():
+    return api_response({'detail': 'Не найдено.'}, status=404)
+
+
+def requested_fields(request):
+    """Поля из ``?fields=id,text``; неизвестные имена пропускаются."""
+    names = request.GET.get('fields', '').split(',')
+    fields = [name for name in names if name in POST_FIELDS]
+    return fields or list(POST_FIELDS)
+
+
+def post_columns(fields):
+    columns = {POST_FIELDS[name] for name in fields}
+    return sorted(columns | {'id', 'pub_date'})
+
+
+def serialize_post(row, fields):
+    data = {}
+    for name in fields:
+        value = row[POST_FIELDS[name]]
+        if name == 'pub_date':
+            value = value.isoformat()
+        elif name == 'image':
+            value = IMAGE_STORAGE.url(value) if value else None
+        data[name] = value
+    return data
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+def posts_page(request, posts, per_page=POSTS_PER_PAGE):
+    """Страница постов по курсору в виде словаря для JSON."""
+    fields = requested_fields(request)
+    rows = posts.values(*post_columns(fields))
+    page_obj = CursorPaginator(rows, per_page).get_page(
+        request.GET.get('cursor')
+    )
+    return paged(request, page_obj, [
+        serialize_post(row, fields) for row in page_obj
+    ])
+
+
+def paged(request, page_obj, results):
+    return {
+        'results': results,
+        'next': page_link(request, page_obj.paginator.next_cursor),
+        'previous': page_link(request, page_obj.paginator.previous_cursor),
+    }
+
+
+@require_safe
+@condition(etag_func=index_etag)
+@cache_anonymous_page(
+    PAGE_CACHE_TIMEOUT,
+    PAGE_STALE_TIMEOUT,
+    version=lambda request: feeds.get_version('index'),
+)
+def index(request):
+    return api_response(posts_page(request, Post.objects.all()))
+
+
+@require_safe
+@condition(etag_func=group_etag)
+@cache_anonymous_page(
+    PAGE_CACHE_TIMEOUT,
+    PAGE_STALE_TIMEOUT,
+    version=group_version,
+)
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).values(
+        'id', 'title', 'slug', 'description'
+    ).first()
+    if group is None:
+        return not_found()
+    data = posts_page(request, Post.objects.filter(group_id=group.pop('id')))
+    data['group'] = group
+    return api_response(data)
+
+
+@require_safe
+@condition(etag_func=profile_etag)
+def profile(request, username):
+    author = User.objects.select_related('stats').filter(
+        username=username
+    ).first()
+    if author is None:
+        return not_found()
+    stats = counters.get_stats(author)
+    data = posts_page(request, Post.objects.filter(author_id=author.id))
+    data['author'] = {
+        'username': author.username,
+        'full_name': author.get_full_name(),
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
+    }
+    return api_response(data)
+
+
+def follow_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return feeds.etag(request, 'index', f'follow:{request.user.id}')
+
+
+@require_safe
+@condition(etag_func=follow_etag)
+def follow_index(request):
+    user = request.user
+    if not user.is_authenticated:
+        return api_response(
+            {'detail': 'Нужна авторизация.'}, status=401
+        )
+    celebrities = timeline.celebrity_ids(user)
+    if celebrities:
+        posts = Post.objects.filter(
+            timeline.mixed_feed_filter(user, celebrities)
+        )
+        return api_response(posts_page(request, posts))
+    # Как и HTML-лента: страница выбирается по индексу ленты, посты
+    # дочитываются одним запросом по первичному ключу.
+    entries = TimelineEntry.objects.filter(user=user).values(
+        'post_id', 'pub_date'
+    )
+    page_obj = CursorPaginator(
+        entries, POSTS_PER_PAGE, keys=('pub_date', 'post_id')
+    ).get_page(request.GET.get('cursor'))
+    fields = requested_fields(request)
+    rows = Post.objects.filter(
+        id__in=[entry['post_id'] for entry in page_obj]
+    ).values(*post_columns(fields))
+    posts = {row['id']: row for row in rows}
+    return api_response(paged(request, page_obj, [
+        serialize_post(posts[entry['post_id']], fields)
+        for entry in page_obj if entry['post_id'] in posts
+    ]))
+
+
+@require_safe
+@condition(etag_func=post_etag)
+@cache_anonymous_page(
+    PAGE_CACHE_TIMEOUT,
+    PAGE_STALE_TIMEOUT,
+    version=post_version,
+)
+def post_detail(request, post_id):
+    fields = requested_fields(request)
+    row = Post.objects.filter(id=post_id).values(
+        *post_columns(fields)
+    ).first()
+    if row is None:
+        return not_found()
+    comments = Comment.objects.filter(post_id=post_id).values(
+        *COMMENT_FIELDS
+    )
+    page_obj = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, keys=('created', 'id'),
+        descending=False,
+    ).get_page(request.GET.get('cursor'))
+    data = paged(request, page_obj, [
+        {
+            'id': comment['id'],
+            'author': comment['author__username'],
+            'text': comment['text'],
+            'created': comment['created'].isoformat(),
+        }
+        for comment in page_obj
+    ])
+    data['post'] = serialize_post(row, fields)
+    return api_response(data)
@@ -0,0 +1,207 @@
+"""Замеры страниц: время ответа, число SQL-запросов и работа базы.
+
+Работа базы считается в шагах виртуальной машины SQLite: это
+ближайший доступный из Python аналог числа просмотренных строк.
+На других базах этот показатель не собирается.
+
+Миллисекунды зависят от машины, поэтому с эталоном сравниваются
+не они, а доля страницы от медианного времени всех страниц прогона.
+"""
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Group, Post, UserStats
+
+User = get_user_model()
+
+# Шаги виртуальной машины SQLite считаются пачками по столько штук.
+STEP_GRANULARITY = 100
+
+# Допуски при сравнении с эталоном: шаги базы могут вырасти на долю
+# THRESHOLD и ещё на одну пачку STEP_GRANULARITY, иначе округление
+# до пачки роняло бы маленькие эталоны; относительное время — на
+# TIME_THRESHOLD и ещё на TIME_SLACK медианы; число запросов — не может.
+# Время шумит сильнее шагов.
+THRESHOLD = 0.25
+TIME_THRESHOLD = 0.5
+TIME_SLACK = 0.2
+
+
+class Route:
+    """Запрос, который замеряется: имя, метод, адрес, данные формы."""
+
+    def __init__(self, name, url, method='get', data=None, guest=False):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.data = data or {}
+        self.guest = guest
+
+
+class StepCounter:
+    """Считает шаги виртуальной машины SQLite внутри блока with."""
+
+    def __init__(self):
+        self.steps = None
+
+    def _tick(self):
+        self.steps += STEP_GRANULARITY
+        return 0
+
+    def __enter__(self):
+        if connection.vendor == 'sqlite':
+            connection.ensure_connection()
+            self.steps = 0
+            connection.connection.set_progress_handler(
+                self._tick, STEP_GRANULARITY
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.steps is not None:
+            connection.connection.set_progress_handler(None, 0)
+
+
+def pick_objects():
+    """Самые нагруженные объекты базы: их страницы и замеряются."""
+    author = UserStats.objects.order_by('-posts_count').first().user
+    reader = UserStats.objects.order_by('-following_count').first().user
+    stranger = User.objects.exclude(
+        following__user=reader
+    ).exclude(pk=reader.pk).order_by('pk').first()
+    group = Group.objects.order_by('pk').first()
+    post = Post.objects.filter(author=author).first()
+    own_post, _ = Post.objects.get_or_create(
+        author=reader, text='Пост для замеров'
+    )
+    return {
+        'author': author,
+        'reader': reader,
+        'stranger': stranger,
+        'group': group,
+        'post': post,
+        'own_post': own_post,
+    }
+
+
+def routes(objects):
+    """Все страницы из posts/urls.py с данными для них."""
+    author, stranger = objects['author'], objects['stranger']
+    post_id = objects['post'].id
+    own_id = objects['own_post'].id
+    group_slug = objects['group'].slug
+    return [
+        Route('index', reverse('posts:index')),
+        Route('index_guest', reverse('posts:index'), guest=True),
+        Route('group_list', reverse('posts:group_list', args=[group_slug])),
+        Route('profile', reverse('posts:profile', args=[author.username])),
+        Route('post_detail', reverse('posts:post_detail', args=[post_id])),
+        Route('comments', reverse('posts:comments', args=[post_id])),
+        Route('search', reverse('posts:search') + '?q=текст'),
+        Route('follow_index', reverse('posts:follow_index')),
+        Route('post_create_form', reverse('posts:post_create')),
+        Route('post_create', reverse('posts:post_create'), 'post',
+              {'text': 'Новый пост для замеров'}),
+        Route('post_edit_form', reverse('posts:post_edit', args=[own_id])),
+        Route('post_edit', reverse('posts:post_edit', args=[own_id]),
+              'post', {'text': 'Исправленный пост для замеров'}),
+        Route('add_comment', reverse('posts:add_comment', args=[post_id]),
+              'post', {'text': 'Комментарий для замеров'}),
+        Route('profile_follow',
+              reverse('posts:profile_follow', args=[stranger.username])),
+        Route('profile_unfollow',
+              reverse('posts:profile_unfollow', args=[stranger.username])),
+        Route('api_index', reverse('posts:api_index')),
+        Route('api_post', reverse('posts:api_post', args=[post_id])),
+        Route('api_group', reverse('posts:api_group', args=[group_slug])),
+        Route('api_profile',
+              reverse('posts:api_profile', args=[author.username])),
+        Route('api_follow', reverse('posts:api_follow')),
+        Route('export', reverse('posts:export')),
+    ]
+
+
+def measure(client, route):
+    """Один холодный запрос: кэш очищается, ответ читается целиком."""
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries, StepCounter() as vm:
+        started = time.perf_counter()
+        response = getattr(client, route.method)(route.url, route.data)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = (time.perf_counter() - started) * 1000
+    if response.status_code >= 400:
+        raise AssertionError(
+            f'{route.name}: ответ {response.status_code}'
+        )
+    return elapsed, len(queries), vm.steps
+
+
+def run(repeat=5):
+    """Замеры всех страниц: медиана времени, запросы и шаги базы."""
+    objects = pick_objects()
+    user_client = Client()
+    user_client.force_login(objects['reader'])
+    guest_client = Client()
+    results = {}
+    for route in routes(objects):
+        client = guest_client if route.guest else user_client
+        runs = [measure(client, route) for _ in range(repeat)]
+        results[route.name] = {
+            'ms': round(statistics.median(run[0] for run in runs), 2),
+            'queries': max(run[1] for run in runs),
+            'steps': max(
+                (run[2] for run in runs if run[2] is not None), default=None
+            ),
+        }
+    return results
+
+
+def relative_times(results, names):
+    """Время страниц ``names`` в долях медианы их времени."""
+    reference = statistics.median(results[name]['ms'] for name in names)
+    return {
+        name: results[name]['ms'] / reference if reference else 0
+        for name in names
+    }
+
+
+def regressions(results, baseline, threshold=THRESHOLD,
+                time_threshold=TIME_THRESHOLD):
+    """Описания показателей, которые хуже эталона сверх допуска."""
+    problems = []
+    common = sorted(set(results) & set(baseline))
+    if not common:
+        return problems
+    shares = relative_times(results, common)
+    expected_shares = relative_times(baseline, common)
+    for name in common:
+        actual, expected = results[name], baseline[name]
+        if actual['queries'] > expected['queries']:
+            problems.append(
+                f'{name}: запросов {actual["queries"]}, '
+                f'было {expected["queries"]}'
+            )
+        share, expected_share = shares[name], expected_shares[name]
+        if share > expected_share * (1 + time_threshold) + TIME_SLACK:
+            problems.append(
+                f'{name}: {share:.2f} медианы времени, '
+                f'было {expected_share:.2f}'
+            )
+        if (
+            actual['steps'] is not None and expected['steps'] is not None
+            and actual['steps']
+            > expected['steps'] * (1 + threshold) + STEP_GRANULARITY
+        ):
+            problems.append(
+                f'{name}: шагов базы {actual["steps"]}, '
+                f'было {expected["steps"]}'
+            )
+    return problems
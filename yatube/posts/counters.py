@@ -0,0 +1,224 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Comment, Follow, Post, PostMonthCount, UserStats
+
+User = get_user_model()
+
+STATS_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+# Сколько id передавать в один запрос с IN: в SQLite число параметров
+# запроса ограничено.
+IN_CHUNK_SIZE = 500
+
+
+def recount_user(user_id):
+    """Пересчитывает счётчики пользователя по исходным таблицам."""
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'posts_count': Post.objects.filter(author_id=user_id).count(),
+            'followers_count': Follow.objects.filter(
+                author_id=user_id
+            ).count(),
+            'following_count': Follow.objects.filter(user_id=user_id).count(),
+        },
+    )
+    return stats
+
+
+def get_stats(user):
+    """Счётчики пользователя; недостающая строка создаётся пересчётом."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return recount_user(user.pk)
+
+
+def change_user_counter(user_id, field, delta):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta}
+    )
+    # Строки ещё нет: при росте создаём её пересчётом, который уже учтёт
+    # текущую запись. При уменьшении пользователь может удаляться целиком,
+    # поэтому ничего не создаём.
+    if not updated and delta > 0:
+        recount_user(user_id)
+
+
+def change_user_counters(deltas):
+    """Сдвигает счётчики многих пользователей: ``{user_id: {поле: дельта}}``.
+
+    Существующие строки обновляются одним executemany, недостающие
+    создаются пересчётом, который уже учитывает новые записи.
+    """
+    user_ids = list(deltas)
+    existing = set()
+    for start in range(0, len(user_ids), IN_CHUNK_SIZE):
+        existing.update(UserStats.objects.filter(
+            pk__in=user_ids[start:start + IN_CHUNK_SIZE]
+        ).values_list('pk', flat=True))
+    rows = []
+    for user_id, changes in deltas.items():
+        if user_id in existing:
+            rows.append(
+                [changes.get(field, 0) for field in STATS_FIELDS] + [user_id]
+            )
+        else:
+            recount_user(user_id)
+    assignments = ', '.join(
+        f'{field} = {field} + %s' for field in STATS_FIELDS
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE posts_userstats SET {assignments} WHERE user_id = %s',
+            rows,
+        )
+
+
+def change_comments_counter(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta
+    )
+
+
+def change_comments_counters(deltas):
+    """Сдвигает счётчики комментариев многих постов: ``{post_id: дельта}``."""
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'UPDATE posts_post SET comments_count = comments_count + %s '
+            'WHERE id = %s',
+            [(delta, post_id) for post_id, delta in deltas.items()],
+        )
+
+
+def month_start(moment):
+    """Первое число месяца, к которому относится момент времени."""
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def recount_month(month):
+    next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+    start, end = (
+        timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+        for day in (month, next_month)
+    )
+    count = Post.objects.filter(pub_date__gte=start, pub_date__lt=end).count()
+    PostMonthCount.objects.update_or_create(
+        month=month, defaults={'posts_count': count}
+    )
+
+
+def change_month_counter(pub_date, delta):
+    month = month_start(pub_date)
+    updated = PostMonthCount.objects.filter(month=month).update(
+        posts_count=F('posts_count') + delta
+    )
+    if not updated and delta > 0:
+        recount_month(month)
+
+
+def month_totals():
+    """Число постов по месяцам одним GROUP BY по таблице постов."""
+    rows = Post.objects.annotate(month=TruncMonth('pub_date')).order_by(
+    ).values_list('month').annotate(total=Count('id'))
+    return {
+        timezone.localtime(month).date(): total for month, total in rows
+    }
+
+
+def recount_months(chunk_size):
+    """Сверяет счётчики постов по месяцам с таблицей постов."""
+    totals = month_totals()
+    existing = {row.month: row for row in PostMonthCount.objects.all()}
+    created, changed = [], []
+    for month, total in totals.items():
+        row = existing.pop(month, None)
+        if row is None:
+            created.append(PostMonthCount(month=month, posts_count=total))
+        elif row.posts_count != total:
+            row.posts_count = total
+            changed.append(row)
+    PostMonthCount.objects.bulk_create(created, chunk_size)
+    PostMonthCount.objects.bulk_update(changed, ['posts_count'], chunk_size)
+    PostMonthCount.objects.filter(pk__in=[
+        row.pk for row in existing.values()
+    ]).delete()
+    yield len(totals), len(created) + len(changed) + len(existing)
+
+
+def recount_posts(chunk_size):
+    """Пересчитывает comments_count постов порциями по первичному ключу."""
+    last_id = 0
+    while True:
+        ids = list(
+            Post.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+                'pk', flat=True
+            )[:chunk_size]
+        )
+        if not ids:
+            return
+        totals = dict(
+            Comment.objects.filter(post_id__in=ids).order_by().values_list(
+                'post_id'
+            ).annotate(total=Count('id'))
+        )
+        posts = Post.objects.filter(pk__in=ids).only('pk', 'comments_count')
+        changed = []
+        for post in posts:
+            total = totals.get(post.pk, 0)
+            if post.comments_count != total:
+                post.comments_count = total
+                changed.append(post)
+        Post.objects.bulk_update(changed, ['comments_count'])
+        yield len(ids), len(changed)
+        last_id = ids[-1]
+
+
+def _totals(queryset, key, ids):
+    return dict(
+        queryset.filter(**{f'{key}__in': ids}).order_by().values_list(
+            key
+        ).annotate(total=Count('id'))
+    )
+
+
+def recount_users(chunk_size):
+    """Пересчитывает счётчики пользователей порциями по первичному ключу."""
+    last_id = 0
+    while True:
+        ids = list(
+            User.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+                'pk', flat=True
+            )[:chunk_size]
+        )
+        if not ids:
+            return
+        posts = _totals(Post.objects, 'author_id', ids)
+        followers = _totals(Follow.objects, 'author_id', ids)
+        following = _totals(Follow.objects, 'user_id', ids)
+        existing = UserStats.objects.in_bulk(ids)
+        created, changed = [], []
+        for user_id in ids:
+            values = {
+                'posts_count': posts.get(user_id, 0),
+                'followers_count': followers.get(user_id, 0),
+                'following_count': following.get(user_id, 0),
+            }
+            stats = existing.get(user_id)
+            if stats is None:
+                created.append(UserStats(user_id=user_id, **values))
+                continue
+            if any(getattr(stats, f) != v for f, v in values.items()):
+                for field, value in values.items():
+                    setattr(stats, field, value)
+                changed.append(stats)
+        UserStats.objects.bulk_create(created, ignore_conflicts=True)
+        UserStats.objects.bulk_update(changed, STATS_FIELDS)
+        yield len(ids), len(created) + len(changed)
+        last_id = ids[-1]
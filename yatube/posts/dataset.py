@@ -0,0 +1,177 @@
+"""Генератор синтетических данных для нагрузочных замеров.
+
+Модуль не трогает базу и не импортирует модели: записи строятся в
+процессах пула и передаются в ``ContentImporter`` основного процесса
+в том же виде, что и строки JSONL для ``import_content``.
+"""
+import datetime
+import itertools
+import random
+
+from faker import Faker
+
+SCALES = {
+    '1k': 1_000,
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+
+# Показатели степенных распределений: чем больше, тем сильнее перекос
+# в сторону первых по рангу авторов и групп.
+AUTHOR_SKEW = 1.1
+GROUP_SKEW = 1.3
+FOLLOW_SKEW = 1.2
+
+POSTS_WITHOUT_GROUP = 0.3
+COMMENT_COUNTS = (0, 1, 2, 3, 5)
+COMMENT_COUNT_WEIGHTS = (50, 20, 15, 10, 5)
+BURST_PROBABILITY = 0.01
+BURST_SIZE = (50, 300)
+BURST_WINDOW = datetime.timedelta(hours=2)
+
+SENTENCE_POOL_SIZE = 1000
+
+
+def plan(posts):
+    """Размеры остальных таблиц для заданного числа постов."""
+    return {
+        'posts': posts,
+        'users': max(50, posts // 20),
+        'groups': max(5, posts // 2000),
+    }
+
+
+def username(rank):
+    return f'user{rank}'
+
+
+def group_slug(rank):
+    return f'group-{rank}'
+
+
+def zipf_weights(count, skew):
+    """Накопленные веса для ``random.choices``: ранг r весит 1 / r^skew."""
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** skew for rank in range(count)
+    ))
+
+
+class Chunk:
+    """Параметры одной порции записей, которую строит процесс пула."""
+
+    def __init__(self, kind, number, start, count, options):
+        self.kind = kind
+        self.number = number
+        self.start = start
+        self.count = count
+        self.options = options
+
+
+def build(chunk):
+    """Записи порции; вызывается в процессах пула."""
+    rng = random.Random(f'{chunk.options["seed"]}:{chunk.kind}:{chunk.number}')
+    fake = Faker('ru_RU')
+    fake.seed_instance(rng.random())
+    builder = {
+        'users': _users,
+        'groups': _groups,
+        'follows': _follows,
+        'posts': _posts,
+    }[chunk.kind]
+    return list(builder(chunk, rng, fake))
+
+
+def _users(chunk, rng, fake):
+    for rank in range(chunk.start, chunk.start + chunk.count):
+        yield {
+            'type': 'user',
+            'username': username(rank),
+            'first_name': fake.first_name(),
+            'last_name': fake.last_name(),
+        }
+
+
+def _groups(chunk, rng, fake):
+    for rank in range(chunk.start, chunk.start + chunk.count):
+        yield {
+            'type': 'group',
+            'slug': group_slug(rank),
+            'title': fake.catch_phrase()[:200],
+            'description': fake.paragraph(),
+        }
+
+
+def _follows(chunk, rng, fake):
+    """Подписки с хвостом Парето: у немногих авторов огромная аудитория."""
+    users = chunk.options['users']
+    weights = zipf_weights(users, FOLLOW_SKEW)
+    average = chunk.options['follows']
+    for rank in range(chunk.start, chunk.start + chunk.count):
+        # Среднее распределения Парето с показателем 1.5 равно трём.
+        wanted = min(users - 1, int(rng.paretovariate(1.5) * average / 3))
+        authors = set(rng.choices(range(users), cum_weights=weights,
+                                  k=wanted))
+        authors.discard(rank)
+        for author in sorted(authors):
+            yield {
+                'type': 'follow',
+                'user': username(rank),
+                'author': username(author),
+            }
+
+
+def _posts(chunk, rng, fake):
+    """Посты и комментарии к ним; изредка пост собирает всплеск ответов.
+
+    Идентификаторы постов сквозные, от начала порции: импортёр пишет
+    записи пачками, и в одну пачку могут попасть посты нескольких порций.
+    """
+    options = chunk.options
+    users = options['users']
+    author_weights = zipf_weights(users, AUTHOR_SKEW)
+    group_weights = zipf_weights(options['groups'], GROUP_SKEW)
+    sentences = [fake.sentence() for _ in range(SENTENCE_POOL_SIZE)]
+    now = datetime.datetime.fromisoformat(options['now'])
+    period = datetime.timedelta(days=options['days']).total_seconds()
+    comments = []
+    for number in range(chunk.start, chunk.start + chunk.count):
+        author = rng.choices(range(users), cum_weights=author_weights)[0]
+        group = None
+        if rng.random() >= POSTS_WITHOUT_GROUP:
+            group = group_slug(rng.choices(
+                range(options['groups']), cum_weights=group_weights
+            )[0])
+        pub_date = now - datetime.timedelta(seconds=rng.random() * period)
+        post = {
+            'type': 'post',
+            'id': number,
+            'author': username(author),
+            'group': group,
+            'text': ' '.join(rng.choices(sentences, k=rng.randint(1, 6))),
+            'pub_date': pub_date.isoformat(),
+        }
+        if options['images'] and rng.random() < options['image_share']:
+            post['image'] = rng.choice(options['images'])
+        yield post
+        if rng.random() < BURST_PROBABILITY:
+            count, window = rng.randint(*BURST_SIZE), BURST_WINDOW
+        else:
+            count = rng.choices(COMMENT_COUNTS, COMMENT_COUNT_WEIGHTS)[0]
+            window = now - pub_date
+        for _ in range(count):
+            created = pub_date + rng.random() * window
+            comments.append({
+                'type': 'comment',
+                'post': number,
+                'author': username(rng.randrange(users)),
+                'text': rng.choice(sentences),
+                'created': min(created, now).isoformat(),
+            })
+    yield from comments
+
+
+def chunks(kind, total, size, options):
+    for number, start in enumerate(range(0, total, size)):
+        yield Chunk(kind, number, start, min(size, total - start), options)
@@ -0,0 +1,68 @@
+import csv
+import json
+
+from .models import Comment, Post
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_COLUMNS = ('type', 'id', 'post', 'group', 'date', 'image', 'text')
+
+IMAGE_STORAGE = Post._meta.get_field('image').storage
+
+
+def author_rows(author_id, chunk_size=1000):
+    """Посты и комментарии автора словарями, без загрузки всех строк.
+
+    Строки читаются серверным курсором по ``chunk_size`` штук, модели
+    не создаются, поэтому память не зависит от объёма выгрузки.
+    """
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'group__slug', 'pub_date', 'image', 'text'
+    )
+    for post_id, group, pub_date, image, text in posts.iterator(chunk_size):
+        yield {
+            'type': 'post',
+            'id': post_id,
+            'group': group,
+            'date': pub_date.isoformat(),
+            'image': IMAGE_STORAGE.url(image) if image else None,
+            'text': text,
+        }
+    comments = Comment.objects.filter(author_id=author_id).order_by(
+        'id'
+    ).values_list('id', 'post_id', 'created', 'text')
+    for comment_id, post_id, created, text in comments.iterator(chunk_size):
+        yield {
+            'type': 'comment',
+            'id': comment_id,
+            'post': post_id,
+            'date': created.isoformat(),
+            'text': text,
+        }
+
+
+class Echo:
+    """Буфер для csv.writer, который просто возвращает записанное."""
+
+    def write(self, value):
+        return value
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.DictWriter(Echo(), CSV_COLUMNS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_lines(author_id, export_format, chunk_size=1000):
+    """Строки выгрузки автора в формате ``jsonl`` или ``csv``."""
+    encode = jsonl_lines if export_format == 'jsonl' else csv_lines
+    return encode(author_rows(author_id, chunk_size))
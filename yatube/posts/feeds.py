@@ -0,0 +1,125 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+from .models import Group, Post
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+# Поколение имён авторов и групп. Они видны на любой странице ленты,
+# поэтому правка имени (редкая, через админку) сбрасывает все фрагменты.
+NAMES = 'names'
+
+
+def post_feeds(author_id, group_id):
+    """Ленты, в которые попадает пост с такими автором и группой."""
+    feeds = ['index', f'author:{author_id}']
+    if group_id is not None:
+        feeds.append(f'group:{group_id}')
+    return feeds
+
+
+def card_feeds(post):
+    """Поколения данных, которые карточка поста берёт у автора и группы."""
+    feeds = [f'user:{post.author_id}']
+    if post.group_id is not None:
+        feeds.append(f'group_info:{post.group_id}')
+    return feeds
+
+
+def group_id_key(slug):
+    return f'posts:group_id:{slug}'
+
+
+def post_feeds_key(post_id):
+    return f'posts:post_page_feeds:{post_id}'
+
+
+def group_page_feeds(slug):
+    """Поколения страницы группы: её посты и её описание.
+
+    Id группы по адресу запоминается в кэше, чтобы проверка ETag и
+    кэша страниц обходилась без базы. None — такой группы нет.
+    """
+    group_id = cache.get(group_id_key(slug))
+    if group_id is None:
+        group_id = Group.objects.filter(slug=slug).values_list(
+            'id', flat=True
+        ).first()
+        if group_id is None:
+            return None
+        cache.set(group_id_key(slug), group_id, None)
+    return [f'group:{group_id}', f'group_info:{group_id}']
+
+
+def post_page_feeds(post_id):
+    """Поколения страницы поста: сам пост, автор (число его постов)
+    и группа. Список запоминается в кэше; None — поста нет.
+    """
+    names = cache.get(post_feeds_key(post_id))
+    if names is None:
+        saved = Post.objects.filter(pk=post_id).values_list(
+            'author_id', 'group_id'
+        ).first()
+        if saved is None:
+            return None
+        author_id, group_id = saved
+        names = [f'post:{post_id}', f'author:{author_id}']
+        if group_id is not None:
+            names.append(f'group_info:{group_id}')
+        cache.set(post_feeds_key(post_id), names, None)
+    return names
+
+
+def version_key(feed):
+    return f'posts:feed_version:{feed}'
+
+
+def _fresh_version():
+    # Версия потерянного ключа не должна совпасть ни с одной из прежних,
+    # иначе из кэша вернутся фрагменты, собранные до вытеснения.
+    return int(time.time() * 1000)
+
+
+def get_versions(feeds):
+    """Поколения нескольких лент за одно обращение: ``{лента: версия}``."""
+    keys = {feed: version_key(feed) for feed in feeds}
+    versions = cache.get_many(list(keys.values()))
+    for key in keys.values():
+        if key not in versions:
+            cache.add(key, _fresh_version(), None)
+            versions[key] = cache.get(key)
+    return {feed: versions[key] for feed, key in keys.items()}
+
+
+def get_version(*feeds):
+    """Поколение лент для ключа кэша фрагмента: меняется при каждой правке.
+
+    К лентам всегда добавляется поколение имён NAMES.
+    """
+    feeds += (NAMES,)
+    versions = get_versions(feeds)
+    return '.'.join(str(versions[feed]) for feed in feeds)
+
+
+def bump(feeds):
+    """Начинает новое поколение лент; старые фрагменты доживают TTL."""
+    for feed in feeds:
+        key = version_key(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _fresh_version(), None)
+
+
+def etag(request, *feeds):
+    """Валидатор страницы без рендера: версии лент, зритель и адрес."""
+    raw = '{}|{}|{}|{}'.format(
+        get_version(*feeds),
+        request.user.pk or '',
+        get_language(),
+        request.get_full_path(),
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
@@ -1,11 +1,32 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.translation import gettext_lazy as _
 
+from core.uploads import OversizedUpload, validate_image
 from .models import Post, Comment
 
 
 class PostForm(forms.ModelForm):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Недокачанный файл не передаём ImageField, иначе вместо
+        # ошибки о размере пользователь увидит «файл повреждён».
+        self.oversized = self.files.get('image')
+        if isinstance(self.oversized, OversizedUpload):
+            self.files = self.files.copy()
+            del self.files['image']
+        else:
+            self.oversized = None
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if self.oversized is not None:
+            image = self.oversized
+        if isinstance(image, UploadedFile):
+            image = validate_image(image)
+        return image
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
@@ -0,0 +1,131 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from posts import benchmarks, dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет временную базу данными нужного масштаба, замеряет '
+        'страницы и сравнивает результат с эталоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            action='append',
+            choices=dataset.SCALES,
+            help='Масштаб данных; можно указать несколько раз. '
+                 'По умолчанию 1k.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Сколько раз замерять каждую страницу.',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks.json'),
+            help='Файл с эталонными замерами.',
+        )
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Записать результаты в эталон вместо сравнения.',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=benchmarks.THRESHOLD,
+            help='Допустимый рост шагов базы, доля от эталона.',
+        )
+        parser.add_argument(
+            '--time-threshold',
+            type=float,
+            default=benchmarks.TIME_THRESHOLD,
+            help='Допустимый рост времени в долях медианы всех страниц, '
+                 'доля от эталона.',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Сколько процессов строят данные.',
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        for scale in options['scale'] or ['1k']:
+            results[scale] = self._measure_scale(scale, options)
+            self._print(scale, results[scale])
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline'], encoding='utf-8') as source:
+                baseline = json.load(source)
+        if options['update']:
+            baseline.update(results)
+            with open(options['baseline'], 'w', encoding='utf-8') as output:
+                json.dump(baseline, output, ensure_ascii=False, indent=2,
+                          sort_keys=True)
+                output.write('\n')
+            self.stdout.write(f'Эталон записан в {options["baseline"]}')
+            return
+        problems = []
+        for scale, measured in results.items():
+            problems += [
+                f'[{scale}] {problem}'
+                for problem in benchmarks.regressions(
+                    measured, baseline.get(scale, {}),
+                    options['threshold'], options['time_threshold'],
+                )
+            ]
+        if problems:
+            raise CommandError(
+                'Страницы стали медленнее эталона:\n' + '\n'.join(problems)
+            )
+        self.stdout.write('Регрессий нет.')
+
+    def _measure_scale(self, scale, options):
+        """Замеры на отдельной базе, которая удаляется после прогона."""
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Файл вместо базы в памяти: её не увидят процессы
+                # генератора, и диск участвует в замерах, как в жизни.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    directory, 'benchmark.sqlite3'
+                )
+            setup_test_environment(debug=False)
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            try:
+                call_command(
+                    'generate_dataset', scale=scale,
+                    processes=options['processes'], stdout=StringIO(),
+                )
+                return benchmarks.run(options['repeat'])
+            except AssertionError as error:
+                raise CommandError(str(error))
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def _print(self, scale, results):
+        self.stdout.write(f'Масштаб {scale}:')
+        for name, metrics in results.items():
+            self.stdout.write(
+                f'  {name:<18} {metrics["ms"]:>9.2f} мс '
+                f'{metrics["queries"]:>4} запросов '
+                f'{metrics["steps"] or "-":>10} шагов'
+            )
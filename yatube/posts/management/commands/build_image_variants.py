@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит адаптивные варианты картинок для старых постов.'
+
+    def handle(self, *args, **options):
+        processed = 0
+        posts = (
+            Post.objects.exclude(image='')
+            .filter(image_variants='')
+            .values_list('id', flat=True)
+        )
+        for post_id in posts.iterator():
+            thumbnails.generate(post_id)
+            processed += 1
+        self.stdout.write(f'Обработано постов: {processed}')
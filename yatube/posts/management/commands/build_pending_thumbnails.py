@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит миниатюры постов, которые остались без них: пул потоков '
+        'теряет очередь, если процесс перезапустили до конца работы.'
+    )
+
+    def handle(self, *args, **options):
+        processed = 0
+        posts = (
+            Post.objects.exclude(image='')
+            .filter(thumbnails_ready=False)
+            .values_list('id', flat=True)
+        )
+        for post_id in posts.iterator():
+            thumbnails.generate(post_id)
+            processed += 1
+        self.stdout.write(f'Обработано постов: {processed}')
@@ -0,0 +1,70 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import exports
+from posts.models import Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты и комментарии авторов в отдельные файлы '
+        '<имя пользователя>.<формат>.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames',
+            nargs='*',
+            help='Авторы для выгрузки; по умолчанию все, у кого есть посты.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(exports.FORMATS),
+            default='jsonl',
+            help='Формат файлов.',
+        )
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='Каталог, куда сохранять файлы.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько строк читать из базы за один раз.',
+        )
+
+    def handle(self, *args, **options):
+        authors = User.objects.order_by('id')
+        if options['usernames']:
+            authors = authors.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(
+                authors.values_list('username', flat=True)
+            )
+            if missing:
+                raise CommandError(
+                    'Нет пользователей: ' + ', '.join(sorted(missing))
+                )
+        else:
+            authors = authors.filter(id__in=Post.objects.values('author_id'))
+        os.makedirs(options['output_dir'], exist_ok=True)
+        export_format = options['format']
+        for author_id, username in authors.values_list(
+            'id', 'username'
+        ).iterator():
+            path = os.path.join(
+                options['output_dir'], f'{username}.{export_format}'
+            )
+            lines = 0
+            with open(path, 'w', encoding='utf-8', newline='') as output:
+                for line in exports.export_lines(
+                    author_id, export_format, options['chunk_size']
+                ):
+                    output.write(line)
+                    lines += 1
+            self.stdout.write(f'{path}: строк {lines}')
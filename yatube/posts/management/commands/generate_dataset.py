@@ -0,0 +1,149 @@
+import io
+import multiprocessing
+import os
+import random
+import time
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from PIL import Image
+
+from posts import dataset
+from posts.importer import ContentImporter
+from posts.models import Post
+
+IMAGE_POOL_SIZE = 20
+IMAGE_SIZE = (1200, 800)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками с реалистичными перекосами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            choices=dataset.SCALES,
+            default='10k',
+            help='Число постов: 1k, 10k, 100k, 1m или 10m.',
+        )
+        parser.add_argument(
+            '--posts',
+            type=int,
+            help='Точное число постов вместо --scale.',
+        )
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=15,
+            help='Среднее число подписок на пользователя.',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='За сколько последних дней распределить посты.',
+        )
+        parser.add_argument(
+            '--images',
+            type=float,
+            default=0,
+            help='Доля постов с картинкой, от 0 до 1.',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Сколько процессов строят записи.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Сколько постов или пользователей в одной порции.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк писать в базу за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Зерно генератора: одинаковое зерно даёт одинаковые данные.',
+        )
+
+    def handle(self, *args, **options):
+        posts = options['posts'] or dataset.SCALES[options['scale']]
+        if posts < 1 or options['chunk_size'] < 1:
+            raise CommandError('Размеры должны быть положительными.')
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('Доля картинок должна быть от 0 до 1.')
+        sizes = dataset.plan(posts)
+        params = {
+            'seed': options['seed'],
+            'users': sizes['users'],
+            'groups': sizes['groups'],
+            'follows': options['follows'],
+            'days': options['days'],
+            'now': timezone.now().isoformat(),
+            'image_share': options['images'],
+            'images': self._image_pool(options) if options['images'] else [],
+        }
+        importer = ContentImporter(options['batch_size'])
+        started = time.monotonic()
+        # Порции строятся в пуле процессов, а пишет их один основной:
+        # SQLite допускает только одного писателя. Соединения закрываются
+        # заранее, чтобы дочерние процессы не унаследовали открытые.
+        pool = None
+        if options['processes'] > 1:
+            connections.close_all()
+            pool = multiprocessing.Pool(options['processes'])
+        build = pool.imap if pool else map
+        try:
+            for kind in ('users', 'groups', 'follows', 'posts'):
+                total = sizes['users'] if kind == 'follows' else sizes[kind]
+                for records in build(dataset.build, dataset.chunks(
+                    kind, total, options['chunk_size'], params
+                )):
+                    for record in records:
+                        importer.add(record)
+                    self._report(importer, started)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        importer.finish()
+        for title, count in sorted(importer.imported.items()):
+            self.stdout.write(f'{title}: {count}')
+        self._report(importer, started)
+
+    def _image_pool(self, options):
+        """Несколько картинок, которые посты делят между собой."""
+        storage = Post._meta.get_field('image').storage
+        rng = random.Random(options['seed'])
+        names = []
+        for _ in range(IMAGE_POOL_SIZE):
+            color = tuple(rng.randrange(256) for _ in range(3))
+            content = io.BytesIO()
+            Image.new('RGB', IMAGE_SIZE, color).save(content, 'JPEG')
+            names.append(
+                storage.save('posts/dataset.jpg', ContentFile(
+                    content.getvalue()
+                ))
+            )
+        return names
+
+    def _report(self, importer, started):
+        total = sum(importer.imported.values())
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'Записано строк: {total} за {elapsed:.1f} с '
+            f'({total / elapsed:.0f} в секунду)'
+        )
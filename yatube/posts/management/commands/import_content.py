@@ -0,0 +1,67 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importer import ContentImporter, InvalidRecord, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает пользователей, группы, посты, комментарии и подписки '
+        'из JSONL. Каждая строка — объект с полем type: user, group, '
+        'post, comment или follow.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл JSONL; «-» или без аргумента — стандартный ввод.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк писать в базу за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--create-users',
+            action='store_true',
+            help='Создавать неизвестных авторов без пароля.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть положительным.')
+        importer = ContentImporter(
+            options['batch_size'], options['create_users']
+        )
+        path = options['path']
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        started = time.monotonic()
+        reported = 0
+        try:
+            for number, record in read_records(stream):
+                importer.add(record, number)
+                total = sum(importer.imported.values())
+                if total - reported >= options['batch_size'] * 100:
+                    reported = total
+                    self._report(total, started)
+            importer.finish()
+        except InvalidRecord as error:
+            raise CommandError(str(error))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        for title, count in sorted(importer.imported.items()):
+            self.stdout.write(f'{title}: {count}')
+        self._report(sum(importer.imported.values()), started)
+
+    def _report(self, total, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'Записано строк: {total} за {elapsed:.1f} с '
+            f'({total / elapsed:.0f} в секунду)'
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с исходными таблицами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько строк пересчитывать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        for title, recount in (
+            ('Посты', counters.recount_posts),
+            ('Пользователи', counters.recount_users),
+            ('Месяцы', counters.recount_months),
+        ):
+            checked = fixed = 0
+            for chunk_checked, chunk_fixed in recount(chunk_size):
+                checked += chunk_checked
+                fixed += chunk_fixed
+            self.stdout.write(
+                f'{title}: проверено {checked}, исправлено {fixed}'
+            )
@@ -0,0 +1,45 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from .models import MediaFile, Post
+
+logger = logging.getLogger(__name__)
+
+
+def acquire(name, count=1):
+    """Добавляет ``count`` ссылок на файл ``name``."""
+    if not name:
+        return
+    MediaFile.objects.get_or_create(name=name)
+    MediaFile.objects.filter(name=name).update(
+        references=F('references') + count
+    )
+
+
+def release(name):
+    """Снимает ссылку на файл; последний владелец удаляет файл.
+
+    Файл и его миниатюры удаляются после коммита и только если за это
+    время на него никто снова не сослался.
+    """
+    if not name:
+        return
+    MediaFile.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1
+    )
+    transaction.on_commit(lambda: _collect(name))
+
+
+def _collect(name):
+    deleted, _ = MediaFile.objects.filter(name=name, references=0).delete()
+    if not deleted:
+        return
+    storage = Post._meta.get_field('image').storage
+    try:
+        delete(ImageFile(name, storage))
+    except Exception:
+        logger.exception('Не удалось удалить файл %s', name)
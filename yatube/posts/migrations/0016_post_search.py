@@ -0,0 +1,40 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'posts_post_search'
+
+
+def create_index(apps, schema_editor):
+    # Индекс FTS5 есть только в SQLite; на других базах поиск идёт
+    # через icontains, см. posts/search.py.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+        "text, group_title, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    # Совпадение в тексте поста весит вдвое больше, чем в названии группы.
+    schema_editor.execute(
+        f'INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) '
+        "VALUES ('rank', 'bm25(1.0, 0.5)')"
+    )
+    schema_editor.execute(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, text, group_title) '
+        "SELECT p.id, p.text, COALESCE(g.title, '') FROM posts_post p "
+        'LEFT JOIN posts_group g ON g.id = p.group_id'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_media_files'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def fill_month_counts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostMonthCount = apps.get_model('posts', 'PostMonthCount')
+    rows = Post.objects.annotate(month=TruncMonth('pub_date')).order_by(
+    ).values_list('month').annotate(total=Count('id'))
+    PostMonthCount.objects.bulk_create(
+        PostMonthCount(
+            month=timezone.localtime(month).date(), posts_count=total
+        )
+        for month, total in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostMonthCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+            ],
+            options={
+                'verbose_name': 'Постов за месяц',
+                'verbose_name_plural': 'Постов по месяцам',
+                'ordering': ['month'],
+            },
+        ),
+        migrations.RunPython(fill_month_counts, migrations.RunPython.noop),
+    ]
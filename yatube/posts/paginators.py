@@ -0,0 +1,162 @@
+import base64
+import json
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+FEED_COUNT_TIMEOUT = 60 * 60
+
+
+def feed_count_key(feed):
+    return f'posts:feed_count:{feed}'
+
+
+def invalidate_feed_counts(feeds):
+    cache.delete_many([feed_count_key(feed) for feed in feeds])
+
+
+def pack_token(values):
+    """Упаковывает JSON-значения в непрозрачный токен для URL."""
+    raw = json.dumps(values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def unpack_token(token):
+    """Обратное к ``pack_token``; ``None`` для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_cursor(direction, pub_date, pk):
+    """Упаковывает позицию в ленте в непрозрачный токен для URL."""
+    return pack_token([direction, pub_date.isoformat(), pk])
+
+
+def decode_cursor(token):
+    """Возвращает (direction, pub_date, pk) или None для битого токена."""
+    try:
+        direction, pub_date, pk = unpack_token(token)
+        pub_date = parse_datetime(pub_date)
+    except (TypeError, ValueError):
+        return None
+    if (
+        direction not in (NEXT, PREVIOUS)
+        or pub_date is None
+        or not isinstance(pk, int)
+    ):
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id) без OFFSET и без COUNT(*).
+
+    Страница выбирается условием «строго после/до курсора» и LIMIT,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    ``keys`` — поля даты и идентификатора, по которым запрос
+    фильтруется и сортируется; из них же читаются значения курсора.
+    ``descending=False`` листает от старых записей к новым.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 descending=True):
+        sign = '-' if descending else ''
+        super().__init__(
+            object_list.order_by(*(f'{sign}{key}' for key in keys)),
+            per_page,
+        )
+        self.keys = keys
+        self.descending = descending
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def get_page(self, cursor=None):
+        decoded = decode_cursor(cursor) if cursor else None
+        date_key, id_key = self.keys
+        if decoded is None:
+            direction = NEXT
+            rows = self.object_list
+        else:
+            direction, pub_date, pk = decoded
+            # Движемся к меньшим ключам: вперёд по убывающей ленте или
+            # назад по возрастающей.
+            downward = (direction == NEXT) == self.descending
+            lookup = 'lt' if downward else 'gt'
+            sign = '-' if downward else ''
+            rows = self.object_list.filter(
+                Q(**{f'{date_key}__{lookup}': pub_date})
+                | Q(**{date_key: pub_date, f'{id_key}__{lookup}': pk})
+            ).order_by(f'{sign}{date_key}', f'{sign}{id_key}')
+        rows = list(rows[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, decoded is not None
+        if rows and has_next:
+            self.next_cursor = self._cursor(NEXT, rows[-1])
+        if rows and has_previous:
+            self.previous_cursor = self._cursor(PREVIOUS, rows[0])
+        # Номера страниц условные: шаблону нужны только has_next и
+        # has_previous, а настоящий номер без COUNT(*) неизвестен.
+        number = 2 if self.previous_cursor else 1
+        self.num_pages = number + (1 if self.next_cursor else 0)
+        return self._get_page(rows, number, self)
+
+    def _cursor(self, direction, row):
+        date_key, id_key = self.keys
+        if isinstance(row, dict):
+            return encode_cursor(direction, row[date_key], row[id_key])
+        return encode_cursor(
+            direction, getattr(row, date_key), getattr(row, id_key)
+        )
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор по номеру страницы, который хранит COUNT(*) ленты в кэше.
+
+    Кэш сбрасывается сигналами при создании и удалении постов.
+    """
+
+    def __init__(self, object_list, per_page, feed):
+        super().__init__(object_list, per_page)
+        self.feed = feed
+
+    @cached_property
+    def count(self):
+        key = feed_count_key(self.feed)
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, FEED_COUNT_TIMEOUT)
+        return count
+
+
+def paginate(request, object_list, per_page, keys=('pub_date', 'id'),
+             feed=None):
+    """Страница ленты: ``?page=N`` — по номеру, иначе — по курсору.
+
+    Для ленты с именем ``feed`` число постов берётся из кэша.
+    """
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        if feed is None:
+            paginator = Paginator(object_list, per_page)
+        else:
+            paginator = CachedCountPaginator(object_list, per_page, feed)
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(object_list, per_page, keys)
+    return paginator.get_page(request.GET.get('cursor'))
@@ -0,0 +1,190 @@
+import re
+
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .paginators import NEXT, PREVIOUS, pack_token, unpack_token, paginate
+
+# Полнотекстовый индекс SQLite FTS5: rowid строки равен id поста.
+SEARCH_TABLE = 'posts_post_search'
+
+TERM_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Запрос пользователя в синтаксисе FTS5: все слова, по префиксу.
+
+    Операторы FTS5 из ввода не пропускаются: каждое слово берётся
+    в кавычки, поэтому любой текст даёт корректный запрос.
+    """
+    terms = TERM_RE.findall(query.lower())[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def index_post(post_id, text, group_title):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post_id]
+        )
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, text, group_title) '
+            'VALUES (%s, %s, %s)',
+            [post_id, text, group_title],
+        )
+
+
+def remove_post(post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post_id]
+        )
+
+
+def rename_group(group_id, title):
+    """Обновляет название группы у всех её постов в индексе."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {SEARCH_TABLE} SET group_title = %s WHERE rowid IN '
+            '(SELECT id FROM posts_post WHERE group_id = %s)',
+            [title, group_id],
+        )
+
+
+@transaction.atomic
+def rebuild(chunk_size=1000):
+    """Заново заполняет индекс; возвращает число проиндексированных постов."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    rows = Post.objects.values_list('id', 'text', 'group__title')
+    batch = []
+    indexed = 0
+    for post_id, text, group_title in rows.iterator(chunk_size):
+        batch.append((post_id, text, group_title or ''))
+        if len(batch) == chunk_size:
+            indexed += index_posts(batch)
+            batch = []
+    return indexed + index_posts(batch)
+
+
+def index_posts(batch):
+    """Добавляет в индекс пачку строк (id поста, текст, название группы)."""
+    if batch:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, text, group_title) '
+                'VALUES (%s, %s, %s)',
+                batch,
+            )
+    return len(batch)
+
+
+def filter_posts(queryset, query):
+    """Посты из ``queryset``, подходящие под запрос, без ранжирования."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not is_available():
+        return queryset.filter(
+            Q(text__icontains=query) | Q(group__title__icontains=query)
+        )
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} '
+        f'WHERE {SEARCH_TABLE} MATCH %s',
+        (expression,),
+    ))
+
+
+class SearchPaginator(Paginator):
+    """Курсорный пагинатор результатов поиска по релевантности.
+
+    Строки упорядочены по (rank, rowid) прямо в индексе FTS5, курсор
+    хранит эту пару, поэтому страница стоит одного запроса к индексу
+    с LIMIT и одного запроса за постами по первичному ключу.
+    """
+
+    is_cursor = True
+
+    def __init__(self, expression, per_page):
+        super().__init__(Post.objects.none(), per_page)
+        self.expression = expression
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def get_page(self, cursor=None):
+        decoded = self._decode(cursor) if cursor else None
+        sql = (
+            f'SELECT rowid, rank FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s'
+        )
+        params = [self.expression]
+        if decoded is None:
+            direction = NEXT
+            sql += ' ORDER BY rank, rowid'
+        else:
+            direction, rank, pk = decoded
+            op, order = ('>', 'ASC') if direction == NEXT else ('<', 'DESC')
+            sql += (
+                f' AND (rank {op} %s OR (rank = %s AND rowid {op} %s))'
+                f' ORDER BY rank {order}, rowid {order}'
+            )
+            params += [rank, rank, pk]
+        sql += ' LIMIT %s'
+        params.append(self.per_page + 1)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            hits = db_cursor.fetchall()
+        has_more = len(hits) > self.per_page
+        hits = hits[:self.per_page]
+        if direction == PREVIOUS:
+            hits.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, decoded is not None
+        if hits and has_next:
+            post_id, rank = hits[-1]
+            self.next_cursor = pack_token([NEXT, rank, post_id])
+        if hits and has_previous:
+            post_id, rank = hits[0]
+            self.previous_cursor = pack_token([PREVIOUS, rank, post_id])
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [post_id for post_id, rank in hits]
+        )
+        rows = [posts[post_id] for post_id, rank in hits if post_id in posts]
+        number = 2 if self.previous_cursor else 1
+        self.num_pages = number + (1 if self.next_cursor else 0)
+        return self._get_page(rows, number, self)
+
+    @staticmethod
+    def _decode(token):
+        try:
+            direction, rank, pk = unpack_token(token)
+        except (TypeError, ValueError):
+            return None
+        if (
+            direction not in (NEXT, PREVIOUS)
+            or not isinstance(rank, (int, float))
+            or not isinstance(pk, int)
+        ):
+            return None
+        return direction, rank, pk
+
+
+def search_page(request, query, per_page):
+    """Страница результатов поиска: по релевантности, если есть FTS5."""
+    expression = match_expression(query)
+    if not expression or not is_available():
+        posts = filter_posts(
+            Post.objects.select_related('author', 'group'), query
+        )
+        return paginate(request, posts, per_page)
+    return SearchPaginator(expression, per_page).get_page(
+        request.GET.get('cursor')
+    )
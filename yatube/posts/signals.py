@@ -0,0 +1,196 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import counters, feeds, media, search, timeline
+from .models import Comment, Follow, Group, Post, TimelineEntry
+from .paginators import invalidate_feed_counts
+
+User = get_user_model()
+
+# Поля, которые показываются в карточках постов и на страницах лент.
+USER_SHOWN_FIELDS = ('username', 'first_name', 'last_name')
+GROUP_SHOWN_FIELDS = ('title', 'slug', 'description')
+
+# Посты, которые удаляются в этом потоке: счётчик комментариев у них
+# не меняется, когда каскад удаляет их комментарии по одному.
+_deleting = threading.local()
+
+
+def _deleting_posts():
+    if not hasattr(_deleting, 'posts'):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+def _saved_values(model, instance, fields, update_fields):
+    # Вход на сайт сохраняет только last_login: старые имена не нужны.
+    if instance.pk is None or (
+        update_fields is not None and not set(update_fields) & set(fields)
+    ):
+        return None
+    return model.objects.filter(pk=instance.pk).values_list(
+        *fields
+    ).first()
+
+
+def _shown_changed(instance, fields):
+    saved = instance._saved_shown
+    return saved is not None and saved != tuple(
+        getattr(instance, field) for field in fields
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_saved(sender, instance, **kwargs):
+    instance._saved_group_id = instance._saved_image = None
+    instance._saved_author_id = None
+    if instance.pk is not None:
+        saved = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image', 'author_id'
+        ).first()
+        if saved is not None:
+            (instance._saved_group_id, instance._saved_image,
+             instance._saved_author_id) = saved
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    changed = feeds.post_feeds(instance.author_id, instance.group_id)
+    if created:
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+        counters.change_month_counter(instance.pub_date, 1)
+        timeline.fan_out(instance)
+        invalidate_feed_counts(changed)
+        media.acquire(instance.image.name)
+    else:
+        if instance._saved_image != instance.image.name:
+            media.acquire(instance.image.name)
+            media.release(instance._saved_image)
+        if instance._saved_group_id != instance.group_id:
+            moved = [
+                f'group:{instance._saved_group_id}',
+                f'group:{instance.group_id}',
+            ]
+            invalidate_feed_counts(moved)
+            changed.extend(moved)
+            cache.delete(feeds.post_feeds_key(instance.pk))
+        if instance._saved_author_id not in (None, instance.author_id):
+            _move_to_author(instance, instance._saved_author_id)
+            changed.append(f'author:{instance._saved_author_id}')
+    if search.is_available():
+        search.index_post(
+            instance.pk,
+            instance.text,
+            instance.group.title if instance.group_id else '',
+        )
+    feeds.bump(changed + [f'post:{instance.pk}'])
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    _deleting_posts().add(instance.pk)
+
+
+def _move_to_author(post, old_author_id):
+    """Переносит пост к новому автору: счётчики и ленты подписчиков."""
+    counters.change_user_counter(old_author_id, 'posts_count', -1)
+    counters.change_user_counter(post.author_id, 'posts_count', 1)
+    invalidate_feed_counts([
+        f'author:{old_author_id}', f'author:{post.author_id}'
+    ])
+    cache.delete(feeds.post_feeds_key(post.pk))
+    TimelineEntry.objects.filter(post_id=post.pk).delete()
+    timeline.fan_out(post)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    _deleting_posts().discard(instance.pk)
+    changed = feeds.post_feeds(instance.author_id, instance.group_id)
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    counters.change_month_counter(instance.pub_date, -1)
+    invalidate_feed_counts(changed)
+    media.release(instance.image.name)
+    cache.delete(feeds.post_feeds_key(instance.pk))
+    if search.is_available():
+        search.remove_post(instance.pk)
+    feeds.bump(changed + [f'post:{instance.pk}'])
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, update_fields, **kwargs):
+    instance._saved_shown = _saved_values(
+        User, instance, USER_SHOWN_FIELDS, update_fields
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if not created and _shown_changed(instance, USER_SHOWN_FIELDS):
+        feeds.bump([feeds.NAMES, f'user:{instance.pk}'])
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_names(sender, instance, update_fields, **kwargs):
+    instance._saved_shown = _saved_values(
+        Group, instance, GROUP_SHOWN_FIELDS, update_fields
+    )
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created and search.is_available():
+        search.rename_group(instance.pk, instance.title)
+    if not created and _shown_changed(instance, GROUP_SHOWN_FIELDS):
+        cache.delete(feeds.group_id_key(instance._saved_shown[1]))
+        feeds.bump([feeds.NAMES, f'group_info:{instance.pk}'])
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    cache.delete(feeds.group_id_key(instance.slug))
+    if search.is_available():
+        search.rename_group(instance.pk, '')
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comments_counter(instance.post_id, 1)
+        feeds.bump([f'post:{instance.post_id}'])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in _deleting_posts():
+        return
+    counters.change_comments_counter(instance.post_id, -1)
+    feeds.bump([f'post:{instance.post_id}'])
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        counters.change_user_counter(instance.author_id, 'followers_count', 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        feeds.bump([
+            f'follow:{instance.user_id}', f'followers:{instance.author_id}'
+        ])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.restore_fan_out(instance.author_id)
+    feeds.bump([
+        f'follow:{instance.user_id}', f'followers:{instance.author_id}'
+    ])
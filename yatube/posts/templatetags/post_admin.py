@@ -0,0 +1,75 @@
+import datetime
+
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.contrib.admin.views.main import ORDER_VAR
+from django.db.models import Sum
+from django.db.models.functions import ExtractYear
+from django.utils import formats
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+from posts.models import PostMonthCount
+
+register = template.Library()
+
+
+def _choice(link, title, count):
+    return {'link': link, 'title': f'{title} ({count})'}
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def post_date_hierarchy(cl):
+    """Иерархия дат списка постов по готовым счётчикам за месяц.
+
+    Годы и месяцы берутся из PostMonthCount вместо SELECT DISTINCT
+    по всей таблице постов. Дни внутри месяца и списки с другими
+    фильтрами считаются стандартным тегом админки.
+    """
+    field = cl.date_hierarchy
+    year_field, month_field = f'{field}__year', f'{field}__month'
+    extra = set(cl.params) - {year_field, month_field, ORDER_VAR}
+    if extra or month_field in cl.params:
+        return date_hierarchy(cl)
+    months = PostMonthCount.objects.filter(posts_count__gt=0)
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field}__'])
+
+    year = cl.params.get(year_field)
+    if year is None:
+        years = list(
+            months.annotate(year=ExtractYear('month')).order_by(
+                'year'
+            ).values_list('year').annotate(total=Sum('posts_count'))
+        )
+        if len(years) != 1:
+            return {
+                'show': True,
+                'back': None,
+                'choices': [
+                    _choice(link({year_field: str(y)}), y, total)
+                    for y, total in years
+                ],
+            }
+        year = years[0][0]
+    try:
+        year = int(year)
+    except ValueError:
+        return date_hierarchy(cl)
+    months = months.filter(
+        month__gte=datetime.date(year, 1, 1),
+        month__lt=datetime.date(year + 1, 1, 1),
+    )
+    return {
+        'show': True,
+        'back': {'link': link({}), 'title': _('All dates')},
+        'choices': [
+            _choice(
+                link({year_field: year, month_field: row.month.month}),
+                capfirst(formats.date_format(row.month, 'YEAR_MONTH_FORMAT')),
+                row.posts_count,
+            )
+            for row in months
+        ],
+    }
@@ -0,0 +1,55 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from posts import feeds
+
+register = template.Library()
+
+CARD_TEMPLATE = 'includes/post_card.html'
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def card_key(post, show_author, versions=None):
+    names = feeds.card_feeds(post)
+    if versions is None:
+        versions = feeds.get_versions(names)
+    return 'posts:card:{}:{}:{}:{}:{}'.format(
+        post.pk,
+        post.updated.timestamp(),
+        '.'.join(str(versions[name]) for name in names),
+        int(show_author),
+        get_language(),
+    )
+
+
+@register.simple_tag
+def post_cards(posts, show_author=True):
+    """Готовая разметка карточек постов страницы.
+
+    Карточки берутся из кэша одним запросом; правка поста меняет
+    ``updated`` и вместе с ним ключ, так что старая карточка не
+    показывается; так же ключ меняют правки имени автора и группы.
+    Недостающие карточки рендерятся и кладутся в кэш.
+    """
+    posts = list(posts)
+    versions = feeds.get_versions({
+        name for post in posts for name in feeds.card_feeds(post)
+    })
+    keys = [card_key(post, show_author, versions) for post in posts]
+    cached = cache.get_many(keys)
+    rendered = {}
+    cards = []
+    for key, post in zip(keys, posts):
+        card = cached.get(key)
+        if card is None:
+            card = render_to_string(
+                CARD_TEMPLATE, {'post': post, 'show_author': show_author}
+            )
+            rendered[key] = card
+        cards.append(mark_safe(card))
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    return cards
@@ -0,0 +1,47 @@
+import json
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+# Ширина колонки ленты: на узких экранах картинка во всю ширину окна.
+IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+DEFAULT_WIDTH = 960
+
+
+def _srcset(variants):
+    return format_html_join(
+        ', ', '{} {}w', ((item['url'], item['width']) for item in variants)
+    )
+
+
+@register.simple_tag
+def responsive_image(post, css_class='card-img my-2'):
+    """Тег <picture> с WebP и srcset из ``post.image_variants``.
+
+    Пустая строка, если варианты ещё не построены: шаблон тогда
+    показывает миниатюру или исходную картинку.
+    """
+    if not post.image_variants:
+        return ''
+    variants = json.loads(post.image_variants)
+    fallback = variants['jpeg']
+    default = next(
+        (item for item in fallback if item['width'] >= DEFAULT_WIDTH),
+        fallback[-1],
+    )
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        (
+            (name, _srcset(items), IMAGE_SIZES)
+            for name, items in variants.items()
+            if name != 'jpeg'
+        ),
+    )
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" loading="lazy" alt=""></picture>',
+        sources, css_class, default['url'], _srcset(fallback), IMAGE_SIZES,
+        default['width'], default['height'],
+    )
@@ -1,17 +1,35 @@
+import hashlib
+import io
+import json
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from http import HTTPStatus
+from PIL import Image
 
-from posts.models import Post, Group
+from posts import thumbnails
+from posts.models import MediaFile, Post, Group
 
 User = get_user_model()
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
@@ -65,6 +83,7 @@ class PostCreateFormTests(TestCase):
             },
             follow=True
         )
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertEqual(response.status_code, HTTPStatus.OK)
         self.assertEqual(Post.objects.count(), posts_count + 1)
         self.assertEqual(Post.objects.get(pk=2).text, 'Текст нового поста')
@@ -75,7 +94,7 @@ class PostCreateFormTests(TestCase):
             Post.objects.filter(
                 text='Текст нового поста',
                 group=PostCreateFormTests.group.id,
-                image='posts/small.gif'
+                image=f'posts/{digest[:2]}/{digest}.gif'
             ).exists()
         )
 
@@ -99,3 +118,203 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(response.status_code, HTTPStatus.OK)
         self.assertEqual(post.group, another_group)
         self.assertEqual(post.text, 'Отредактированный текст поста')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_new_post_waits_for_thumbnails(self):
+        """Пока миниатюры строятся, показывается исходная картинка."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    'pending.gif', SMALL_GIF, content_type='image/gif'
+                ),
+            },
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertFalse(post.thumbnails_ready)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id})
+        )
+        self.assertContains(response, post.image.url)
+
+    def test_generate_stores_dimensions(self):
+        """Фоновая задача строит миниатюры и сохраняет размеры картинки."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                'ready.gif', SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        thumbnails.generate(post.id)
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnails_ready)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+
+    def test_pending_thumbnails_are_built_by_command(self):
+        """Команда достраивает миниатюры, потерянные при перезапуске."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                'lost.gif', SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        out = io.StringIO()
+        call_command('build_pending_thumbnails', stdout=out)
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnails_ready)
+        self.assertIn('Обработано постов: 1', out.getvalue())
+
+    def test_listing_does_not_look_up_thumbnails(self):
+        """Карточки с вариантами не обращаются к хранилищу миниатюр."""
+        for name in ('first.gif', 'second.gif'):
+            post = Post.objects.create(
+                author=self.user,
+                text='Пост с картинкой',
+                image=SimpleUploadedFile(
+                    name, SMALL_GIF, content_type='image/gif'
+                ),
+            )
+            thumbnails.generate(post.id)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>', count=2)
+        self.assertFalse([
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']
+        ])
+
+    def test_generate_builds_responsive_variants(self):
+        """Адаптивные варианты попадают в srcset и <source> для WebP."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                'variants.gif', SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        thumbnails.generate(post.id)
+        post.refresh_from_db()
+        variants = json.loads(post.image_variants)
+        self.assertEqual(
+            [item['width'] for item in variants['webp']],
+            list(thumbnails.VARIANT_WIDTHS),
+        )
+        self.assertTrue(variants['webp'][0]['url'].endswith('.webp'))
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id})
+        )
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(
+            response, '{} 480w'.format(variants['jpeg'][0]['url'])
+        )
+
+    def test_same_image_is_stored_once(self):
+        """Одинаковые картинки делят файл, счётчик ссылок и миниатюры."""
+        posts = [
+            Post.objects.create(
+                author=self.user,
+                text='Пост с картинкой',
+                image=SimpleUploadedFile(
+                    name, SMALL_GIF, content_type='image/gif'
+                ),
+            )
+            for name in ('meme.gif', 'meme-copy.gif')
+        ]
+        self.assertEqual(posts[0].image.name, posts[1].image.name)
+        media = MediaFile.objects.get(name=posts[0].image.name)
+        self.assertEqual(media.references, 2)
+        thumbnails.generate(posts[0].id)
+        with mock.patch.object(thumbnails, 'get_thumbnail') as thumbnail:
+            thumbnails.generate(posts[1].id)
+        thumbnail.assert_not_called()
+        posts[1].refresh_from_db()
+        self.assertTrue(posts[1].thumbnails_ready)
+        self.assertNotEqual(posts[1].image_variants, '')
+        for post in posts:
+            post.delete()
+        media.refresh_from_db()
+        self.assertEqual(media.references, 0)
+
+
+def make_jpeg(size, orientation=None):
+    """JPEG заданного размера, при необходимости с EXIF-поворотом."""
+    image = Image.new('RGB', size, 'white')
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadLimitsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, name, content):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name, content, content_type='image/jpeg'
+                ),
+            },
+        )
+
+    @override_settings(UPLOAD_MAX_SIZE=100)
+    def test_oversized_upload_is_rejected(self):
+        """Слишком большой файл отклоняется без сохранения поста."""
+        response = self.create_post('big.jpg', make_jpeg((64, 64)))
+        self.assertIn(
+            'Файл слишком большой',
+            response.context['form'].errors['image'][0],
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(UPLOAD_MAX_PIXELS=100)
+    def test_too_many_pixels_are_rejected(self):
+        """Размеры картинки проверяются по заголовку файла."""
+        response = self.create_post('wide.jpg', make_jpeg((20, 10)))
+        self.assertIn(
+            'Слишком большое изображение',
+            response.context['form'].errors['image'][0],
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_exif_orientation_is_applied(self):
+        """Картинка с EXIF-поворотом сохраняется уже развёрнутой."""
+        self.create_post('rotated.jpg', make_jpeg((4, 2), orientation=6))
+        post = Post.objects.get()
+        self.assertEqual((post.image.width, post.image.height), (2, 4))
@@ -1,7 +1,19 @@
+import json
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F
 
-from posts.models import Group, Post
+from posts import search
+from posts.importer import ContentImporter
+from posts.models import (
+    Comment, Follow, Group, Post, PostMonthCount, TimelineEntry, UserStats,
+)
 
 User = get_user_model()
 
@@ -32,3 +44,194 @@ class PostModelTest(TestCase):
         for model, expected_value in object_names.items():
             with self.subTest(model=model):
                 self.assertEqual(model.__str__(), expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.author.stats.posts_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1
+        )
+        Follow.objects.filter(user=self.reader).delete()
+        post.delete()
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, 0)
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_post_delete_does_not_count_down_each_comment(self):
+        """Удаление поста не обновляет счётчик за каждый комментарий."""
+        queries = []
+        for count in (1, 30):
+            post = Post.objects.create(author=self.author, text='Пост')
+            Comment.objects.bulk_create(
+                Comment(post=post, author=self.reader, text=f'Да {number}')
+                for number in range(count)
+            )
+            Post.objects.filter(pk=post.pk).update(comments_count=count)
+            with CaptureQueriesContext(connection) as captured:
+                post.delete()
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Да'
+        )
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_recount_counters_fixes_drift(self):
+        """Команда сверки восстанавливает разошедшиеся счётчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        Post.objects.update(comments_count=7)
+        UserStats.objects.update(posts_count=7)
+        call_command('recount_counters', chunk_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).posts_count, 0
+        )
+
+
+class ImportContentTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def import_records(self, records, **options):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.jsonl', encoding='utf-8'
+        ) as source:
+            for record in records:
+                source.write(json.dumps(record, ensure_ascii=False) + '\n')
+            source.flush()
+            out = StringIO()
+            call_command('import_content', source.name, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_writes_rows_and_derived_data(self):
+        """Импорт пишет строки пачками и обновляет счётчики и ленты."""
+        out = self.import_records([
+            {'type': 'group', 'slug': 'cats', 'title': 'Коты'},
+            {'type': 'post', 'id': 'a', 'author': 'author', 'group': 'cats',
+             'text': 'Пушистый кот', 'pub_date': '2020-05-01T10:00:00'},
+            {'type': 'post', 'id': 'b', 'author': 'newbie',
+             'text': 'Привет', 'pub_date': '2020-06-01T10:00:00'},
+            {'type': 'comment', 'post': 'a', 'author': 'newbie',
+             'text': 'Мяу', 'created': '2020-05-02T10:00:00'},
+            {'type': 'follow', 'user': 'reader', 'author': 'newbie'},
+        ], batch_size=2, create_users=True)
+        self.assertIn('в секунду', out)
+        post = Post.objects.get(text='Пушистый кот')
+        self.assertEqual(post.group.slug, 'cats')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.comments.get().created.month, 5)
+        newbie = User.objects.get(username='newbie')
+        self.assertFalse(newbie.has_usable_password())
+        self.assertEqual(newbie.stats.posts_count, 1)
+        self.assertEqual(newbie.stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 2
+        )
+        self.assertEqual(PostMonthCount.objects.count(), 2)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2
+        )
+        if search.is_available():
+            self.assertEqual(
+                list(search.filter_posts(Post.objects.all(), 'кот')), [post]
+            )
+        recount = StringIO()
+        call_command('recount_counters', stdout=recount)
+        self.assertEqual(recount.getvalue().count('исправлено 0'), 3)
+        Post.objects.create(author=self.author, text='После импорта')
+
+    def test_import_large_batch_counts_new_users_once(self):
+        """Большая пачка пишется целиком, счётчики новых не удваиваются."""
+        records = [
+            {'type': 'post', 'author': 'newbie', 'text': f'Пост {number}'}
+            for number in range(600)
+        ]
+        records.append({'type': 'follow', 'user': 'reader',
+                        'author': 'newbie'})
+        self.import_records(records, create_users=True)
+        stats = User.objects.get(username='newbie').stats
+        self.assertEqual(stats.posts_count, 600)
+        self.assertEqual(stats.followers_count, 1)
+
+    def test_import_resolves_posts_of_earlier_batches(self):
+        """Комментарий находит пост прошлой пачки, повторный id — новый."""
+        self.import_records([
+            {'type': 'post', 'id': 1, 'author': 'author', 'text': 'Первый'},
+            {'type': 'post', 'id': '1', 'author': 'author', 'text': 'Второй'},
+            {'type': 'comment', 'post': 1, 'author': 'reader', 'text': 'А'},
+            {'type': 'post', 'id': 1, 'author': 'author', 'text': 'Третий'},
+            {'type': 'comment', 'post': 1, 'author': 'reader', 'text': 'Б'},
+            {'type': 'comment', 'post': '1', 'author': 'reader', 'text': 'В'},
+        ], batch_size=1)
+        self.assertEqual(
+            dict(Comment.objects.values_list('text', 'post__text')),
+            {'А': 'Первый', 'Б': 'Третий', 'В': 'Второй'},
+        )
+
+    def test_import_keys_do_not_collide_with_live_writes(self):
+        """Посты, созданные сайтом во время импорта, не мешают ключам."""
+        importer = ContentImporter(batch_size=1)
+        importer.add({'type': 'post', 'author': 'author', 'text': 'Первый'})
+        Post.objects.create(author=self.reader, text='С сайта')
+        importer.add({'type': 'post', 'author': 'author', 'text': 'Второй'})
+        importer.finish()
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 2
+        )
+
+    def test_import_rejects_unknown_author(self):
+        """Неизвестный автор без --create-users останавливает импорт."""
+        with self.assertRaisesMessage(CommandError, 'Строка 1'):
+            self.import_records([
+                {'type': 'post', 'author': 'nobody', 'text': 'Текст'},
+            ])
+        self.assertFalse(Post.objects.exists())
+
+
+class GenerateDatasetTest(TestCase):
+    def test_generates_consistent_skewed_data(self):
+        """Генератор даёт согласованные данные с перекосом по авторам."""
+        call_command(
+            'generate_dataset', posts=300, processes=1, chunk_size=100,
+            stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(User.objects.count(), 50)
+        top, *rest = UserStats.objects.order_by(
+            '-posts_count'
+        ).values_list('posts_count', flat=True)
+        self.assertGreater(top, 3 * rest[len(rest) // 2])
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F('post__pub_date')).exists()
+        )
+        recount = StringIO()
+        call_command('recount_counters', stdout=recount)
+        self.assertEqual(recount.getvalue().count('исправлено 0'), 3)
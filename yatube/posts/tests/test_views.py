@@ -1,5 +1,11 @@
+import csv
+import json
+import os
 import shutil
 import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -7,10 +13,27 @@ from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from http import HTTPStatus
 
-from posts.models import Post, Group, Comment, Follow
+from core.templatetags.pagination import elided_page_range
+from core.testing import QueryAssertionsMixin
+
+from posts import benchmarks, counters, timeline
+from posts.models import (
+    Post, Group, Comment, Follow, PostMonthCount, TimelineEntry,
+    UserStats,
+)
 from posts.forms import PostForm
+from posts.views import (
+    COMMENTS_PER_PAGE, PAGE_CACHE_TIMEOUT, comments_page
+)
+from posts.paginators import CachedCountPaginator
+from posts.templatetags.post_cards import card_key, post_cards
 
 User = get_user_model()
 
@@ -317,18 +340,49 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(comment.text, comment_on_post_page.text)
 
     def test_index_cache(self):
-        """Тест кэша."""
+        """Тест кэша: фрагмент живёт до изменения ленты."""
         response = self.authorized_client.get(reverse('posts:index'))
         have_cache = response.content
-        one_post = Post.objects.get(id=10)
-        one_post.delete()
+        Post.objects.filter(id=10).update(text='Изменено мимо сигналов')
         response = self.authorized_client.get(reverse('posts:index'))
         saved_cache = response.content
-        cache.clear()
+        Post.objects.get(id=10).delete()
         response = self.authorized_client.get(reverse('posts:index'))
-        after_clearing_cache = response.content
+        after_delete = response.content
         self.assertEqual(have_cache, saved_cache)
-        self.assertNotEqual(saved_cache, after_clearing_cache)
+        self.assertNotEqual(saved_cache, after_delete)
+        self.assertNotContains(response, 'Изменено мимо сигналов')
+
+    def test_feed_fragments_follow_post_edit(self):
+        """Правка поста сразу видна в закэшированных лентах."""
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        post = Post.objects.get(id=15)
+        post.text = 'Отредактированный текст'
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Отредактированный текст')
+
+    def test_feed_fragments_follow_author_rename(self):
+        """Новое имя автора сразу видно в закэшированных лентах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        self.user.first_name = 'Переименованный'
+        self.user.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Переименованный')
 
     def test_follow_for_authorized_user(self):
         """Авторизованный юзер может подписываться на других пользователей."""
@@ -385,3 +439,783 @@ class PaginatorViewsTest(TestCase):
             reverse('posts:index')
         )
         self.assertNotEqual(author_post, PaginatorViewsTest.post)
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.user)
+            for i in range(POSTS_NUMBER)
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_cursor_pages_cover_feed_without_gaps(self):
+        """Курсоры вперёд и назад обходят ленту без пропусков."""
+        first_page = self.guest_client.get(reverse('posts:index'))
+        page_obj = first_page.context['page_obj']
+        self.assertEqual(len(page_obj), POSTS_ON_FIRST_PAGE)
+        self.assertFalse(page_obj.has_previous())
+        self.assertTrue(page_obj.has_next())
+        second_page = self.guest_client.get(
+            reverse('posts:index'),
+            {'cursor': page_obj.paginator.next_cursor}
+        )
+        second_obj = second_page.context['page_obj']
+        self.assertEqual(len(second_obj), POSTS_ON_SECOND_PAGE)
+        self.assertFalse(second_obj.has_next())
+        self.assertEqual(
+            [post.id for post in page_obj] + [post.id for post in second_obj],
+            list(Post.objects.values_list('id', flat=True))
+        )
+        back_page = self.guest_client.get(
+            reverse('posts:index'),
+            {'cursor': second_obj.paginator.previous_cursor}
+        )
+        self.assertEqual(
+            list(back_page.context['page_obj']), list(page_obj)
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор отдаёт первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(
+            text='Старый пост', author=cls.author
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(TimelineTest.reader)
+
+    def follow_page_posts(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_timeline_follows_subscriptions(self):
+        """Лента пополняется при подписке и новом посте, чистится отпиской."""
+        self.reader_client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'})
+        )
+        self.assertEqual(self.follow_page_posts(), [self.old_post])
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(
+            self.follow_page_posts(), [new_post, self.old_post]
+        )
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'author'})
+        )
+        self.assertEqual(self.follow_page_posts(), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_former_celebrity_posts_stay_in_timeline(self):
+        """Посты, не разложенные у знаменитости, остаются в ленте."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=new_post).exists()
+        )
+        Follow.objects.get(user=other).delete()
+        self.assertEqual(
+            self.follow_page_posts(), [new_post, self.old_post]
+        )
+
+    def test_author_change_moves_post(self):
+        """Смена автора переносит пост в ленты и счётчики нового автора."""
+        other = User.objects.create_user(username='other')
+        other_reader = User.objects.create_user(username='other_reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other_reader, author=other)
+        post = Post.objects.create(text='Чужой пост', author=self.author)
+        profile = reverse('posts:profile', kwargs={'username': 'other'})
+        etag = self.reader_client.get(profile)['ETag']
+        post.author = other
+        post.save()
+        self.assertEqual(self.follow_page_posts(), [self.old_post])
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=other_reader, post=post, author=other
+        ).exists())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1
+        )
+        self.assertEqual(UserStats.objects.get(user=other).posts_count, 1)
+        response = self.reader_client.get(profile, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Чужой пост')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=3)
+    def test_former_celebrity_backfill_is_one_statement(self):
+        """Раскладка бывшей знаменитости не делает запрос на подписчика."""
+        for number in range(4):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'fan{number}'),
+                author=self.author,
+            )
+        with CaptureQueriesContext(connection) as queries:
+            Follow.objects.filter(user__username='fan0').delete()
+        inserts = [
+            query for query in queries
+            if query['sql'].startswith('INSERT')
+            and 'posts_timelineentry' in query['sql']
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            TimelineEntry.objects.filter(post=self.old_post).count(), 3
+        )
+
+    def test_backfill_copies_many_posts(self):
+        """Подписка переносит в ленту больше постов, чем влезает в INSERT."""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.author)
+            for number in range(600)
+        )
+        timeline.backfill(self.reader.id, self.author.id)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 601
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_posts_are_read_on_request(self):
+        """Посты авторов-знаменитостей не раскладываются, но видны в ленте."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(
+            self.follow_page_posts(), [new_post, self.old_post]
+        )
+
+
+class CachedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        for i in range(POSTS_NUMBER):
+            Post.objects.create(text=f'Пост {i}', author=cls.user)
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_count_is_cached_and_reset_on_new_post(self):
+        """Число постов ленты берётся из кэша и сбрасывается новым постом."""
+        CachedCountPaginator(Post.objects.all(), 10, 'index').count
+        with self.assertNumQueries(0):
+            paginator = CachedCountPaginator(Post.objects.all(), 10, 'index')
+            self.assertEqual(paginator.count, POSTS_NUMBER)
+        Post.objects.create(text='Ещё пост', author=self.user)
+        response = self.guest_client.get(reverse('posts:index') + '?page=2')
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, POSTS_NUMBER + 1
+        )
+
+    def test_elided_page_range(self):
+        """Номера страниц выводятся окном вокруг текущей."""
+        paginator = Paginator(range(1000), 10)
+        self.assertEqual(
+            elided_page_range(paginator.page(50)),
+            [1, None, 48, 49, 50, 51, 52, None, 100]
+        )
+        self.assertEqual(
+            elided_page_range(paginator.page(1)),
+            [1, 2, 3, None, 100]
+        )
+        self.assertEqual(
+            elided_page_range(Paginator(range(30), 10).page(2)), [1, 2, 3]
+        )
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(text='Текст поста', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_are_shared_and_reset_on_edit(self):
+        """Карточка берётся из кэша, пока пост не отредактирован."""
+        card, = post_cards([self.post])
+        self.assertIn('Текст поста', card)
+        cache.set(card_key(self.post, True), 'из кэша')
+        self.assertEqual(post_cards([self.post]), ['из кэша'])
+        self.post.text = 'Новый текст'
+        self.post.save()
+        card, = post_cards([self.post])
+        self.assertIn('Новый текст', card)
+
+    def test_cards_follow_author_and_group_names(self):
+        """Правка имени автора или названия группы меняет карточку."""
+        group = Group.objects.create(title='Коты', slug='cats')
+        post = Post.objects.create(
+            text='Текст', author=self.user, group=group
+        )
+        post_cards([post])
+        self.user.first_name = 'Новое'
+        self.user.save()
+        group.slug = 'new-cats'
+        group.save()
+        card, = post_cards([
+            Post.objects.select_related('author', 'group').get(pk=post.pk)
+        ])
+        self.assertIn('Новое', card)
+        self.assertIn('/group/new-cats/', card)
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(text='Текст поста', author=cls.user)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_anonymous_pages_are_cached_until_change(self):
+        """Анонимам страница отдаётся из кэша до изменения данных."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Да')
+
+    def test_authorized_users_bypass_page_cache(self):
+        """Авторизованные пользователи получают страницу без кэша."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_stale_page_served_while_rebuilding(self):
+        """Пока страницу пересобирает другой запрос, отдаётся старая копия."""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        later = time.time() + PAGE_CACHE_TIMEOUT + 1
+        with mock.patch('core.decorators.time.time', return_value=later):
+            with mock.patch.object(cache, 'add', return_value=False):
+                response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Текст поста', author=cls.user)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def test_unchanged_pages_return_not_modified(self):
+        """Неизменившиеся страницы отвечают 304 до изменения данных."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.reader_client.get(url)['ETag']
+                response = self.reader_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+                self.post.save()
+                response = self.reader_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_follow_changes_profile_etag(self):
+        """Подписка меняет валидатор профиля."""
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        etag = self.reader_client.get(url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.user)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Отписаться')
+
+    def test_new_post_of_author_changes_post_etag(self):
+        """Новый пост автора меняет валидатор страницы поста."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        etag = self.reader_client.get(url)['ETag']
+        Post.objects.create(text='Ещё пост', author=self.user)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_group_edit_changes_group_etag(self):
+        """Правка группы меняет валидатор и кэш её страницы."""
+        group = Group.objects.create(title='Котики', slug='cats')
+        url = reverse('posts:group_list', kwargs={'slug': group.slug})
+        etag = self.reader_client.get(url)['ETag']
+        Client().get(url)
+        group.title = 'Кошки'
+        group.save()
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Кошки')
+        self.assertContains(Client().get(url), 'Кошки')
+
+    def test_renamed_group_slug(self):
+        """После смены адреса группы старый адрес отвечает 404."""
+        group = Group.objects.create(title='Котики', slug='cats')
+        old_url = reverse('posts:group_list', kwargs={'slug': 'cats'})
+        self.reader_client.get(old_url)
+        group.slug = 'kittens'
+        group.save()
+        response = self.reader_client.get(old_url)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@yatube.ru', password='pass'
+        )
+        cls.group = Group.objects.create(
+            title='Котики', slug='cats', description='Про котиков'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост номер {i} про собак', author=cls.user
+            )
+            for i in range(12)
+        ]
+        cls.cat_post = Post.objects.create(
+            text='Рыжий кот на окне', author=cls.user, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+
+    def test_search_matches_text_and_group_title(self):
+        """Поиск находит посты по словам текста и по названию группы."""
+        for query in ('рыж', 'котики', 'РЫЖИЙ кот'):
+            with self.subTest(query=query):
+                response = self.search(query)
+                self.assertEqual(
+                    list(response.context['page_obj']), [self.cat_post]
+                )
+
+    def test_search_without_results(self):
+        """Запрос без совпадений сообщает, что ничего не найдено."""
+        response = self.search('жираф')
+        self.assertContains(response, 'По запросу «жираф» ничего не найдено.')
+
+    def test_search_is_cursor_paginated(self):
+        """Результаты листаются курсором без пропусков и повторов."""
+        response = self.search('собак')
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 10)
+        self.assertTrue(page_obj.has_next())
+        self.assertContains(response, 'q=%D1%81%D0%BE%D0%B1%D0%B0%D0%BA&')
+        second = self.search(
+            'собак', cursor=page_obj.paginator.next_cursor
+        ).context['page_obj']
+        self.assertEqual(len(second), 2)
+        self.assertCountEqual(
+            list(page_obj) + list(second), self.posts
+        )
+
+    def test_index_follows_edits(self):
+        """Правка поста, удаление поста и переименование группы видны сразу."""
+        post = Post.objects.get(pk=self.posts[0].pk)
+        post.text = 'Теперь про хомяков'
+        post.save()
+        self.assertEqual(
+            list(self.search('хомяков').context['page_obj']), [post]
+        )
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Кошки'
+        group.save()
+        self.assertEqual(
+            list(self.search('кошки').context['page_obj']), [self.cat_post]
+        )
+        Post.objects.get(pk=self.cat_post.pk).delete()
+        self.assertEqual(list(self.search('рыжий').context['page_obj']), [])
+
+    def test_fts_operators_in_query_are_ignored(self):
+        """Спецсимволы FTS5 в запросе не ломают поиск."""
+        response = self.search('"рыж* -(кот:')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            list(response.context['page_obj']), [self.cat_post]
+        )
+        response = self.search('кот" OR NEAR(* -')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(list(response.context['page_obj']), [])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке использует полнотекстовый индекс."""
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'рыж'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.cat_post]
+        )
+
+
+class PostAdminScaleTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@yatube.ru', password='pass'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание'
+        )
+        for i in range(5):
+            author = User.objects.create_user(username=f'author{i}')
+            Post.objects.create(
+                text=f'Пост {i}', author=author, group=cls.group
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def changelist(self, **params):
+        return self.client.get(
+            reverse('admin:posts_post_changelist'), params
+        )
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Список постов не делает запросов на каждую строку."""
+        self.changelist()
+        with CaptureQueriesContext(connection) as few:
+            self.changelist()
+        for i in range(5, 10):
+            Post.objects.create(
+                text=f'Пост {i}', author=self.admin, group=self.group
+            )
+        self.changelist()
+        with CaptureQueriesContext(connection) as many:
+            response = self.changelist()
+        self.assertEqual(len(response.context['cl'].result_list), 10)
+        self.assertEqual(len(many), len(few))
+
+    def test_date_hierarchy_uses_month_counts(self):
+        """Иерархия дат строится по счётчикам постов за месяц."""
+        month = counters.month_start(timezone.now())
+        self.assertEqual(
+            PostMonthCount.objects.get(month=month).posts_count, 5
+        )
+        response = self.changelist()
+        self.assertContains(response, '(5)')
+        Post.objects.first().delete()
+        self.assertEqual(
+            PostMonthCount.objects.get(month=month).posts_count, 4
+        )
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(text='Текст поста', author=cls.user)
+        for i in range(COMMENTS_PER_PAGE + 5):
+            author = User.objects.create_user(username=f'reader{i}')
+            Comment.objects.create(
+                post=cls.post, author=author, text=f'Комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_renders_first_comments(self):
+        """На странице поста первые комментарии, авторы без N+1."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertContains(
+            response, reverse(
+                'posts:comments', kwargs={'post_id': self.post.id}
+            ) + '?cursor='
+        )
+        with self.assertNumQueries(1):
+            comments_page(self.post.id).object_list[-1].author.username
+
+    def test_fragment_returns_next_comments(self):
+        """Фрагмент по курсору отдаёт оставшиеся комментарии по порядку."""
+        first = comments_page(self.post.id)
+        response = self.client.get(
+            reverse('posts:comments', kwargs={'post_id': self.post.id}),
+            {'cursor': first.paginator.next_cursor},
+        )
+        rest = response.context['comments']
+        expected = range(COMMENTS_PER_PAGE, COMMENTS_PER_PAGE + 5)
+        self.assertEqual(
+            [comment.text for comment in rest],
+            [f'Комментарий {i}' for i in expected],
+        )
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, '<html')
+
+    def test_fragment_of_missing_post_is_not_found(self):
+        """Фрагмент комментариев несуществующего поста отвечает 404."""
+        url = reverse('posts:comments', kwargs={'post_id': self.post.id + 1})
+        for _ in range(2):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class FeedAPITest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.user, group=cls.group
+            )
+            for i in range(12)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_are_cursor_paginated(self):
+        """Ленты API отдают страницы по курсору без пропусков."""
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group', kwargs={'slug': self.group.slug}),
+            reverse('posts:api_profile', kwargs={'username': self.user}),
+            reverse('posts:api_follow'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = reader_client.get(url).json()
+                self.assertEqual(len(first['results']), 10)
+                second = reader_client.get(first['next']).json()
+                ids = [post['id'] for post in first['results']]
+                ids += [post['id'] for post in second['results']]
+                self.assertEqual(
+                    ids, [post.id for post in reversed(self.posts)]
+                )
+                self.assertIsNone(second['next'])
+
+    def test_sparse_fieldsets(self):
+        """Параметр fields ограничивает поля постов."""
+        response = self.client.get(
+            reverse('posts:api_index'), {'fields': 'id,author,unknown'}
+        )
+        self.assertEqual(
+            response.json()['results'][0],
+            {'id': self.posts[-1].id, 'author': self.user.username},
+        )
+
+    def test_post_detail_and_conditional_get(self):
+        """Пост отдаётся с комментариями и отвечает 304 по ETag."""
+        url = reverse('posts:api_post', kwargs={'post_id': self.posts[0].id})
+        response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(data['post']['text'], 'Пост 0')
+        self.assertEqual(data['results'][0]['author'], 'reader')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_errors(self):
+        """Неизвестные объекты и лента без входа отвечают JSON-ошибкой."""
+        responses = (
+            (self.client.get(reverse('posts:api_follow')),
+             HTTPStatus.UNAUTHORIZED),
+            (self.client.get(
+                reverse('posts:api_post', kwargs={'post_id': 10 ** 6})
+            ), HTTPStatus.NOT_FOUND),
+        )
+        for response, status in responses:
+            with self.subTest(status=status):
+                self.assertEqual(response.status_code, status)
+                self.assertIn('detail', response.json())
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.other = User.objects.create_user(username='other')
+        cls.post = Post.objects.create(text='Мой пост', author=cls.user)
+        Post.objects.create(text='Чужой пост', author=cls.other)
+        Comment.objects.create(
+            post=cls.post, author=cls.user, text='Мой комментарий'
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_export_streams_own_content(self):
+        """Выгрузка отдаёт потоком только посты и комментарии автора."""
+        response = self.authorized_client.get(reverse('posts:export'))
+        self.assertTrue(response.streaming)
+        self.assertIn('HasNoName.jsonl', response['Content-Disposition'])
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [(row['type'], row['text']) for row in rows],
+            [('post', 'Мой пост'), ('comment', 'Мой комментарий')],
+        )
+        response = self.authorized_client.get(
+            reverse('posts:export'), {'format': 'csv'}
+        )
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(rows[1]['post'], str(self.post.id))
+
+    def test_export_requires_login(self):
+        """Гостя выгрузка отправляет на страницу входа."""
+        response = self.client.get(reverse('posts:export'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    def test_export_command_writes_file_per_author(self):
+        """Команда выгрузки пишет по файлу на каждого автора с постами."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            call_command(
+                'export_content', output_dir=output_dir, format='csv',
+                chunk_size=1, stdout=StringIO(),
+            )
+            self.assertEqual(
+                sorted(os.listdir(output_dir)),
+                ['HasNoName.csv', 'other.csv'],
+            )
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        User.objects.create_user(username='stranger')
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(text='Пост', author=cls.author, group=group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def test_every_route_is_measured(self):
+        """Замеры проходят по всем страницам и ловят лишние запросы."""
+        results = benchmarks.run(repeat=1)
+        self.assertTrue({'index', 'profile', 'post_create'} <= set(results))
+        self.assertEqual(benchmarks.regressions(results, results), [])
+        baseline = {'index': dict(results['index'])}
+        baseline['index']['queries'] -= 1
+        self.assertEqual(len(benchmarks.regressions(results, baseline)), 1)
+
+    def test_regressions_ignore_machine_speed(self):
+        """Эталон с другой машины сравнивается по долям, а не по мс."""
+        results = {
+            'index': {'ms': 10, 'queries': 3, 'steps': None},
+            'profile': {'ms': 20, 'queries': 5, 'steps': None},
+            'post_detail': {'ms': 30, 'queries': 4, 'steps': None},
+        }
+        slower = {
+            name: dict(result, ms=result['ms'] * 3)
+            for name, result in results.items()
+        }
+        self.assertEqual(benchmarks.regressions(slower, results), [])
+        slower['index']['ms'] *= 2
+        self.assertEqual(len(benchmarks.regressions(slower, results)), 1)
+
+    def test_one_step_bucket_is_not_a_regression(self):
+        """Одна лишняя пачка шагов у маленького эталона — не регрессия."""
+        baseline = {'index': {'ms': 10, 'queries': 3, 'steps': 200}}
+        results = {'index': dict(baseline['index'], steps=300)}
+        self.assertEqual(benchmarks.regressions(results, baseline), [])
+        results['index']['steps'] = 400
+        self.assertEqual(len(benchmarks.regressions(results, baseline)), 1)
+
+
+class QueryBudgetTest(QueryAssertionsMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        for number in range(6):
+            author = User.objects.create_user(username=f'author{number}')
+            Follow.objects.create(user=cls.reader, author=author)
+            cls.post = Post.objects.create(
+                text=f'Пост {number}', author=author, group=cls.group
+            )
+            Comment.objects.create(
+                post=cls.post, author=author, text='Комментарий'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_pages_fit_query_budgets(self):
+        """Страницы укладываются в бюджеты запросов и не делают N+1."""
+        pages = {
+            'posts:index': {},
+            'posts:group_list': {'slug': self.group.slug},
+            'posts:profile': {'username': self.post.author.username},
+            'posts:post_detail': {'post_id': self.post.id},
+            'posts:comments': {'post_id': self.post.id},
+            'posts:search': {},
+            'posts:follow_index': {},
+        }
+        for name, kwargs in pages.items():
+            with self.subTest(page=name):
+                with self.assertMaxQueries(settings.QUERY_BUDGETS[name]):
+                    self.authorized_client.get(
+                        reverse(name, kwargs=kwargs), {'q': 'пост'}
+                    )
@@ -0,0 +1,126 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from core import metrics
+
+from . import feeds
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Все размеры, которые запрашивают шаблоны через {% thumbnail %}.
+THUMBNAIL_SIZES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+# Адаптивные варианты: та же обрезка 960x339 в нескольких ширинах,
+# в исходном формате и в WebP. Браузер выбирает файл по srcset/sizes.
+VARIANT_WIDTHS = (480, 960, 1440)
+VARIANT_FORMATS = (
+    ('jpeg', {}),
+    ('webp', {'format': 'WEBP'}),
+)
+VARIANT_RATIO = 339 / 960
+
+
+def variant_sizes():
+    """Пары (формат, geometry, опции) для всех адаптивных вариантов."""
+    for name, extra in VARIANT_FORMATS:
+        for width in VARIANT_WIDTHS:
+            geometry = f'{width}x{round(width * VARIANT_RATIO)}'
+            yield name, geometry, {**THUMBNAIL_SIZES[0][1], **extra}
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def generate(post_id):
+    """Строит миниатюры поста, запоминает размеры картинки."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    # Файлы хранятся по хэшу содержимого: если такую же картинку уже
+    # обработали для другого поста, её миниатюры строить не нужно.
+    donor = Post.objects.filter(
+        image=post.image.name, thumbnails_ready=True
+    ).exclude(image_variants='').exclude(pk=post_id).values_list(
+        'image_width', 'image_height', 'image_variants'
+    ).first()
+    if donor is not None:
+        width, height, variants = donor
+    else:
+        started = time.perf_counter()
+        try:
+            width, height = post.image.width, post.image.height
+            for geometry, options in THUMBNAIL_SIZES:
+                get_thumbnail(post.image, geometry, **options)
+            variants = json.dumps(build_variants(post.image))
+        except Exception:
+            logger.exception(
+                'Не удалось построить миниатюры поста %s', post_id
+            )
+            return
+        metrics.THUMBNAIL_SECONDS.observe(time.perf_counter() - started)
+    updated = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        image_width=width,
+        image_height=height,
+        image_variants=variants,
+        thumbnails_ready=True,
+        updated=timezone.now(),
+    )
+    if updated:
+        feeds.bump(
+            feeds.post_feeds(post.author_id, post.group_id)
+            + [f'post:{post_id}']
+        )
+
+
+def build_variants(image):
+    """Строит адаптивные варианты картинки и возвращает их описание.
+
+    Результат — ``{формат: [{'url', 'width', 'height'}, ...]}`` по
+    возрастанию ширины; он сохраняется в ``Post.image_variants``.
+    """
+    variants = {}
+    for name, geometry, options in variant_sizes():
+        thumbnail = get_thumbnail(image, geometry, **options)
+        variants.setdefault(name, []).append({
+            'url': thumbnail.url,
+            'width': thumbnail.width,
+            'height': thumbnail.height,
+        })
+    return variants
+
+
+def _generate_in_worker(post_id):
+    try:
+        generate(post_id)
+    finally:
+        connection.close()
+
+
+def enqueue(post):
+    """Ставит построение миниатюр в фоновый пул после коммита."""
+    if settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(
+            lambda: _get_executor().submit(_generate_in_worker, post.pk)
+        )
+    else:
+        transaction.on_commit(lambda: generate(post.pk))
@@ -0,0 +1,153 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import paginate
+
+
+def _entries(user_ids, posts):
+    return [
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in user_ids
+        for post_id, author_id, pub_date in posts
+    ]
+
+
+def is_celebrity(author_id):
+    """Посты авторов с огромной аудиторией читаются, а не раскладываются."""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).exists()
+
+
+def celebrity_ids(user):
+    """Авторы из подписок пользователя, чьи посты не раскладываются."""
+    return list(
+        UserStats.objects.filter(
+            user__following__user=user,
+            followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+        ).values_list('user_id', flat=True)
+    )
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.append(user_id)
+        if len(batch) == settings.TIMELINE_BATCH_SIZE:
+            _write(batch, post)
+            batch = []
+    if batch:
+        _write(batch, post)
+
+
+def _write(user_ids, post):
+    TimelineEntry.objects.bulk_create(
+        _entries(user_ids, [(post.id, post.author_id, post.pub_date)]),
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту свежие посты автора после подписки на него."""
+    backfill_followers(author_id, [user_id])
+
+
+def backfill_followers(author_id, user_ids):
+    """Добавляет свежие посты автора в ленты нескольких подписчиков.
+
+    Записи копируются из таблицы постов запросом INSERT ... SELECT
+    на каждого подписчика: посты не загружаются в Python, а уже
+    существующие записи пропускаются.
+    """
+    if is_celebrity(author_id):
+        return
+    ops = connection.ops
+    sql = (
+        f'{ops.insert_statement(ignore_conflicts=True)} posts_timelineentry '
+        '(user_id, post_id, author_id, pub_date) '
+        'SELECT %s, id, author_id, pub_date FROM posts_post '
+        'WHERE author_id = %s ORDER BY pub_date DESC, id DESC LIMIT %s '
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    with connection.cursor() as cursor:
+        for user_id in user_ids:
+            cursor.execute(
+                sql, [user_id, author_id, settings.TIMELINE_BACKFILL_SIZE]
+            )
+
+
+def restore_fan_out(author_id):
+    """Раскладывает посты автора, который перестал быть знаменитостью.
+
+    Пока подписчиков было больше TIMELINE_FANOUT_LIMIT, посты автора
+    читались при показе ленты и в записи ленты не попадали. Когда после
+    отписки счётчик опускается до порога, свежие посты переносятся
+    в ленты всех подписчиков, иначе они пропали бы из лент. Это один
+    INSERT ... SELECT по таблице подписок, сколько бы их ни было.
+    """
+    followers_count = UserStats.objects.filter(
+        user_id=author_id
+    ).values_list('followers_count', flat=True).first()
+    if followers_count != settings.TIMELINE_FANOUT_LIMIT:
+        return
+    ops = connection.ops
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            'posts_timelineentry (user_id, post_id, author_id, pub_date) '
+            'SELECT follow.user_id, post.id, post.author_id, post.pub_date '
+            'FROM posts_follow follow CROSS JOIN ('
+            'SELECT id, author_id, pub_date FROM posts_post '
+            'WHERE author_id = %s ORDER BY pub_date DESC, id DESC LIMIT %s'
+            ') post WHERE follow.author_id = %s '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}',
+            [author_id, settings.TIMELINE_BACKFILL_SIZE, author_id],
+        )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def mixed_feed_filter(user, celebrities):
+    """Условие на посты ленты: разложенные записи и посты знаменитостей."""
+    return (
+        Q(id__in=TimelineEntry.objects.filter(user=user).values('post_id'))
+        | Q(author_id__in=celebrities)
+    )
+
+
+def get_follow_page(request, per_page):
+    """Страница ленты подписок.
+
+    Обычно это один диапазон по индексу ленты пользователя; посты
+    авторов-знаменитостей добавляются при чтении.
+    """
+    user = request.user
+    celebrities = celebrity_ids(user)
+    if celebrities:
+        posts = Post.objects.select_related('author', 'group').filter(
+            mixed_feed_filter(user, celebrities)
+        )
+        return paginate(request, posts, per_page)
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    ).order_by('-pub_date', '-post_id')
+    page_obj = paginate(request, entries, per_page, ('pub_date', 'post_id'))
+    page_obj.object_list = [entry.post for entry in page_obj.object_list]
+    return page_obj
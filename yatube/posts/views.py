@@ -1,82 +1,210 @@
 from django.shortcuts import render, get_object_or_404
-from django.core.paginator import Paginator
 from django.contrib.auth import get_user_model
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_safe
 
-from .models import Post, Group, Follow
+from core.decorators import cache_anonymous_page
+from . import counters, exports, feeds, search, thumbnails, timeline
+from .models import Comment, Post, Group, Follow
 from .forms import PostForm, CommentForm
+from .paginators import CursorPaginator, paginate
 
 POSTS_PER_PAGE = 10
 
+COMMENTS_PER_PAGE = 20
+
+EXPORT_CHUNK_SIZE = 1000
+
+PAGE_CACHE_TIMEOUT = 60 * 5
+
+PAGE_STALE_TIMEOUT = 60 * 30
+
 User = get_user_model()
 
 
+def index_etag(request):
+    return feeds.etag(request, 'index')
+
+
+def group_etag(request, slug):
+    names = feeds.group_page_feeds(slug)
+    return feeds.etag(request, *names) if names else None
+
+
+def group_version(request, slug):
+    return feeds.get_version(*feeds.group_page_feeds(slug) or ())
+
+
+def profile_etag(request, username):
+    author_id = User.objects.filter(
+        username=username
+    ).values_list('id', flat=True).first()
+    if author_id is None:
+        return None
+    return feeds.etag(
+        request,
+        f'author:{author_id}',
+        f'followers:{author_id}',
+        f'follow:{author_id}',
+        f'follow:{request.user.pk}',
+    )
+
+
+def post_etag(request, post_id):
+    names = feeds.post_page_feeds(post_id)
+    return feeds.etag(request, *names) if names else None
+
+
+def post_version(request, post_id):
+    return feeds.get_version(*feeds.post_page_feeds(post_id) or ())
+
+
+@condition(etag_func=index_etag)
+@cache_anonymous_page(
+    PAGE_CACHE_TIMEOUT,
+    PAGE_STALE_TIMEOUT,
+    version=lambda request: feeds.get_version('index'),
+)
 def index(request):
     template = 'posts/index.html'
     post_list = Post.objects.select_related('author', 'group').all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, post_list, POSTS_PER_PAGE, feed='index')
     context = {
         'page_obj': page_obj,
+        'feed_version': feeds.get_version('index'),
     }
     return render(request, template, context)
 
 
+@condition(etag_func=group_etag)
+@cache_anonymous_page(
+    PAGE_CACHE_TIMEOUT,
+    PAGE_STALE_TIMEOUT,
+    version=group_version,
+)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     template = 'posts/group_list.html'
     post_list = group.posts.select_related('author', 'group').all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(
+        request, post_list, POSTS_PER_PAGE, feed=f'group:{group.id}'
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
+        'feed_version': feeds.get_version(f'group:{group.id}'),
     }
     return render(request, template, context)
 
 
+@condition(etag_func=profile_etag)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts_number = user.posts.count()
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    stats = counters.get_stats(user)
     user_posts = user.posts.select_related('author', 'group').all()
-    paginator = Paginator(user_posts, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(
+        request, user_posts, POSTS_PER_PAGE, feed=f'author:{user.id}'
+    )
     following = False
     if request.user.is_authenticated:
         following = user.following.filter(user=request.user).exists()
     context = {
         'username': user,
-        'posts_number': posts_number,
+        'posts_number': stats.posts_count,
+        'stats': stats,
         'page_obj': page_obj,
         'following': following,
+        'feed_version': feeds.get_version(f'author:{user.id}'),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=post_etag)
+@cache_anonymous_page(
+    PAGE_CACHE_TIMEOUT,
+    PAGE_STALE_TIMEOUT,
+    version=post_version,
+)
 def post_detail(request, post_id):
-    post = Post.objects.get(id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
+    comments = comments_page(post.id)
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
-        'count_posts': post.author.posts.count(),
+        'count_posts': counters.get_stats(post.author).posts_count,
         'form': form,
-        'comments': comments
+        'comments': comments,
+        'next_cursor': comments.paginator.next_cursor,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_page(post_id, cursor=None):
+    """Страница комментариев поста от старых к новым, с авторами."""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    )
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, keys=('created', 'id'), descending=False
+    )
+    return paginator.get_page(cursor)
+
+
+@condition(etag_func=post_etag)
+@cache_anonymous_page(
+    PAGE_CACHE_TIMEOUT,
+    PAGE_STALE_TIMEOUT,
+    version=post_version,
+)
+def post_comments(request, post_id):
+    """Фрагмент со следующей страницей комментариев."""
+    if feeds.post_page_feeds(post_id) is None:
+        raise Http404('Пост не найден')
+    comments = comments_page(post_id, request.GET.get('cursor'))
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+        'next_cursor': comments.paginator.next_cursor,
+    }
+    return render(request, 'includes/comments.html', context)
+
+
+@cache_anonymous_page(
+    PAGE_CACHE_TIMEOUT,
+    PAGE_STALE_TIMEOUT,
+    version=lambda request: feeds.get_version('index'),
+)
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = search.search_page(request, query, POSTS_PER_PAGE)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            thumbnails.enqueue(post)
         return redirect('posts:profile', post.author)
     context = {
         'form': form,
@@ -87,19 +215,27 @@ def post_create(request):
 
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
-    if request.user != post.author:
+    if request.user.id != post.author_id:
         return redirect('posts:post_detail', post_id)
     form = PostForm(request.POST or None,
                     instance=post,
                     files=request.FILES or None)
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        if 'image' in form.changed_data:
+            post.thumbnails_ready = False
+            post.image_width = post.image_height = None
+            post.image_variants = ''
+        post.save()
+        if 'image' in form.changed_data and post.image:
+            thumbnails.enqueue(post)
         return redirect('posts:post_detail', post_id)
     context = {'form': form, 'post': post, 'is_edit': True}
     return render(request, 'posts/create_post.html', context)
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -113,15 +249,18 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {'page_obj': page_obj}
+    page_obj = timeline.get_follow_page(request, POSTS_PER_PAGE)
+    context = {
+        'page_obj': page_obj,
+        'feed_version': feeds.get_version(
+            'index', f'follow:{request.user.id}'
+        ),
+    }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -135,8 +274,28 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=user, author=author).delete()
     return redirect('posts:profile', username)
+
+
+@login_required
+@require_safe
+def export_content(request):
+    """Выгрузка всех постов и комментариев пользователя потоком."""
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in exports.FORMATS:
+        export_format = 'jsonl'
+    response = StreamingHttpResponse(
+        exports.export_lines(
+            request.user.id, export_format, EXPORT_CHUNK_SIZE
+        ),
+        content_type=exports.FORMATS[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{request.user.username}.{export_format}"'
+    )
+    return response
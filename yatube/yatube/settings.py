@@ -56,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,7 +65,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware'
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.middleware.QueryInspectorMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -71,7 +74,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.timing.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -96,11 +99,15 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
 
+# Тесты manage.py test идут с core.testing.TestRunner: он выключает пул
+# миниатюр и файл медленных запросов на время прогона.
+TEST_RUNNER = 'core.testing.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -147,10 +154,78 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.timing.TimedLocMemCache',
     }
 }
 
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+
+# Лента подписок: посты авторов, у которых подписчиков больше
+# TIMELINE_FANOUT_LIMIT, не раскладываются по лентам, а читаются на лету.
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BACKFILL_SIZE = 1000
+TIMELINE_BATCH_SIZE = 1000
+
+# Миниатюры новых картинок строятся в фоновом пуле из THUMBNAIL_WORKERS
+# потоков; 0 — строить в том же потоке сразу после коммита. Очередь
+# пула живёт в памяти: после перезапуска процесса недостроенные миниатюры
+# достраивает команда build_pending_thumbnails.
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+
+# Загрузка картинок: файлы больше FILE_UPLOAD_MAX_MEMORY_SIZE пишутся
+# на диск, приём прекращается после UPLOAD_MAX_SIZE байт. Картинки
+# проверяются по заголовку, поворот по EXIF выполняется в отдельном
+# процессе с ограничением памяти и времени.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+UPLOAD_MAX_PIXELS = 40 * 1000 * 1000
+UPLOAD_PROCESS_MEMORY = 512 * 1024 * 1024
+UPLOAD_PROCESS_TIMEOUT = 10
+
+# Поиск N+1: запрос, который повторился больше QUERY_REPEAT_LIMIT раз за
+# одну страницу, и страницы сверх бюджета из QUERY_BUDGETS (имя маршрута
+# -> число запросов) попадают в журнал, а с QUERY_INSPECTOR_RAISE
+# приводят к ошибке.
+QUERY_INSPECTOR_ENABLED = DEBUG
+QUERY_INSPECTOR_RAISE = False
+QUERY_REPEAT_LIMIT = 3
+QUERY_BUDGETS = {
+    'posts:index': 5,
+    'posts:group_list': 6,
+    'posts:profile': 8,
+    'posts:post_detail': 6,
+    'posts:comments': 5,
+    'posts:search': 5,
+    'posts:follow_index': 6,
+}
+
+# Замеры каждого запроса: время SQL, шаблонов, кэша и миниатюр уходят
+# в заголовок Server-Timing и строкой JSON в журнал core.timing.
+SERVER_TIMING_ENABLED = True
+SERVER_TIMING_HEADER = True
+THUMBNAIL_BACKEND = 'core.timing.TimedThumbnailBackend'
+
+# Метрики для Prometheus на /metrics/: доступны персоналу и по заголовку
+# ``Authorization: Bearer <METRICS_TOKEN>``. Воркеры WSGI складывают
+# свои значения в METRICS_DIR раз в METRICS_FLUSH_INTERVAL секунд;
+# без каталога страница показывает только свой процесс. Каталог очищают
+# перед каждым запуском сервера командой clear_metrics (или вызовом
+# core.metrics.clear_directory из хука on_starting gunicorn).
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = 5
+
+# Журнал медленных запросов: бэкенд core.db пишет запросы дольше
+# SLOW_QUERY_THRESHOLD_MS миллисекунд с планом выполнения строками JSON
+# в SLOW_QUERY_LOG, например /var/log/yatube/slow_queries.jsonl; пустое
+# значение (по умолчанию) оставляет только журнал logging. Сводку
+# по отпечаткам показывает команда slow_queries.
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', '')